@@ -1,14 +1,17 @@
 import streamlit as st
-import requests
-import json
-import time
-from datetime import datetime
-import pandas as pd
 import os
-from gtts import gTTS
-import base64
-from io import BytesIO
-import pickle
+import contextlib
+import csv
+import functools
+import hashlib
+import html
+import itertools
+import tempfile
+import uuid
+from collections import deque
+
+import translator_core as core
+import translator_metrics as metrics
 
 # Page configuration
 st.set_page_config(
@@ -18,115 +21,79 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Files under static/ are served by Streamlit at app/static/ (see .streamlit/config.toml)
+STATIC_URL_PREFIX = "app/static"
+
+# History items rendered per page of the History tab
+HISTORY_PAGE_SIZE = int(os.environ.get("TRANSLATOR_HISTORY_PAGE_SIZE", "10"))
+
+# Timings of the Streamlit script itself; the registry keeps one instance across reruns
+RERUN_SECONDS = metrics.histogram("translator_rerun_seconds", "Duration of one run of the Streamlit script")
+HISTORY_RENDER_SECONDS = metrics.histogram("translator_history_render_seconds", "Time to render the History tab")
+AUDIO_PLAYER_SECONDS = metrics.histogram(
+    "translator_audio_player_seconds", "Time to prepare and emit an audio player, synthesis included")
+metrics.start_file_exporter()
+
+# Stylesheet and page script live under static/, so the browser downloads and caches them once
+@st.cache_resource
+def get_static_url(path):
+    """Return the app/static URL of a file under static/, versioned by its content"""
+    with open(os.path.join(core.STATIC_DIR, path), "rb") as f:
+        version = hashlib.sha256(f.read()).hexdigest()[:12]
+    return f"{STATIC_URL_PREFIX}/{path}?v={version}"
+
 # Custom CSS for styling
 def add_custom_css():
-    st.markdown("""
-        <style>
-            .main-header {
-                font-size: 2rem;
-                color: #3949ab;
-                text-align: center;
-                margin-bottom: 1rem;
-            }
-            .dark-theme .main-header {
-                color: #8ab4f8;
-            }
-            .subheader {
-                font-size: 1.2rem;
-                font-weight: 600;
-                margin-bottom: 1rem;
-            }
-            .card {
-                padding: 1.5rem;
-                border-radius: 10px;
-                background-color: white;
-                box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-                margin-bottom: 1rem;
-            }
-            .dark-theme .card {
-                background-color: #222244;
-                color: #f0f0f0;
-            }
-            .feature-card {
-                border-left: 4px solid #3949ab;
-                padding: 0.8rem;
-                background-color: #f5f7ff;
-                border-radius: 0 8px 8px 0;
-                margin-bottom: 0.8rem;
-            }
-            .dark-theme .feature-card {
-                background-color: #16213e;
-                border-left: 4px solid #8ab4f8;
-            }
-            .phrase-item {
-                padding: 0.5rem;
-                border-radius: 5px;
-                cursor: pointer;
-                transition: background-color 0.2s;
-            }
-            .phrase-item:hover {
-                background-color: #f0f0f0;
-            }
-            .dark-theme .phrase-item:hover {
-                background-color: #333355;
-            }
-            .history-item {
-                padding: 0.8rem;
-                border-bottom: 1px solid #eee;
-                cursor: pointer;
-            }
-            .history-item:hover {
-                background-color: #f5f5f5;
-            }
-            .dark-theme .history-item:hover {
-                background-color: #333355;
-            }
-            .footer {
-                text-align: center;
-                margin-top: 2rem;
-                color: #666;
-                font-size: 0.8rem;
-            }
-            .dark-theme .footer {
-                color: #aaa;
-            }
-            .offline-warning {
-                padding: 0.8rem;
-                background-color: #fff3cd;
-                color: #856404;
-                border-radius: 5px;
-                margin-bottom: 1rem;
-            }
-            .dark-theme .offline-warning {
-                background-color: #442c03;
-                color: #ffe69c;
-            }
-            .dark-theme {
-                background-color: #1a1a2e;
-                color: #f0f0f0;
-            }
-            .btn-icon {
-                background: none;
-                border: none;
-                cursor: pointer;
-                padding: 0.25rem 0.5rem;
-                border-radius: 4px;
-            }
-            .btn-icon:hover {
-                background-color: #f0f0f0;
-            }
-            .dark-theme .btn-icon:hover {
-                background-color: #333355;
-            }
-        </style>
-    """, unsafe_allow_html=True)
+    """Load static/css/app.css and static/js/app.js; each run sends this one tag instead of the stylesheet"""
+    st.html(
+        f'<script src="{get_static_url("js/app.js")}" data-stylesheet="{get_static_url("css/app.css")}"></script>',
+        unsafe_allow_javascript=True
+    )
+
+# Phrasebook items never change, so their markup and widget keys are built once per process
+@st.cache_resource
+def get_phrasebook_items():
+    """Return {category: [(phrase, html, use_key, listen_key), ...]} for the Phrase Book tab"""
+    return {
+        category: [
+            (phrase, f'<div class="phrase-item">{html.escape(phrase)}</div>',
+             f"phrase_{phrase.replace(' ', '_')}", f"listen_{phrase.replace(' ', '_')}")
+            for phrase in phrases
+        ]
+        for category, phrases in core.get_phrase_index().categories.items()
+    }
+
+# Feature cards below the translator, emitted as a single element
+FEATURES_HTML = """
+<p class='subheader'>Features</p>
+<div class="feature-grid">
+    <div class="feature-card">
+        <h5>Modern Translation</h5>
+        <small>Leveraging AI for accurate language translations</small>
+    </div>
+    <div class="feature-card">
+        <h5>Travel Ready</h5>
+        <small>Common phrases and offline capabilities for travelers</small>
+    </div>
+    <div class="feature-card">
+        <h5>Text-to-Speech</h5>
+        <small>Hear the correct pronunciation with native speakers</small>
+    </div>
+</div>
+"""
 
 # Initialize session state
 def init_session_state():
     if 'translation_history' not in st.session_state:
-        st.session_state.translation_history = []
+        # With a history store the History tab pages from disk, so the session keeps no copy
+        st.session_state.translation_history = (
+            deque(maxlen=core.HISTORY_MAX_ITEMS) if core.get_history_store() is None else None
+        )
+    if 'history_page' not in st.session_state:
+        st.session_state.history_page = 0
     if 'cached_translations' not in st.session_state:
-        st.session_state.cached_translations = {}
+        # Bounded in bytes and counted against the process-wide session memory budget
+        st.session_state.cached_translations = core.SessionCache()
     if 'dark_mode' not in st.session_state:
         st.session_state.dark_mode = False
     if 'offline_mode' not in st.session_state:
@@ -137,149 +104,241 @@ def init_session_state():
         st.session_state.speech_rate = 1.0
     if 'auto_translate' not in st.session_state:
         st.session_state.auto_translate = False
+    if 'stream_translations' not in st.session_state:
+        st.session_state.stream_translations = True
+    if 'fanout_langs' not in st.session_state:
+        st.session_state.fanout_langs = ["es", "fr", "de"]
 
-# Audio playback helper function
-def get_audio_player(text, lang):
-    """Generate an HTML audio player for the given text and language"""
+# Translate text for this session: offline mode and the session cache come from session state
+def translate_text(text, source_lang, target_lang, formality):
+    """Translate text with core.translate_text, reporting backend failures in the page"""
     try:
-        tts = gTTS(text=text, lang=lang, slow=False)
-        audio_bytes = BytesIO()
-        tts.write_to_fp(audio_bytes)
-        audio_bytes.seek(0)
-        audio_base64 = base64.b64encode(audio_bytes.read()).decode()
-        audio_player = f'<audio controls autoplay="true"><source src="data:audio/mp3;base64,{audio_base64}" type="audio/mp3"></audio>'
-        return audio_player
-    except Exception as e:
-        st.error(f"Error generating audio: {e}")
+        return core.translate_text(
+            text, source_lang, target_lang, formality,
+            st.session_state.offline_mode, st.session_state.cached_translations
+        )
+    except core.TranslationBackendError as e:
+        st.error(f"Translation failed: {e}")
+        return ""
+
+# Public URL of a cached clip when the audio cache lives under the static directory
+def get_audio_url(digest):
+    """Return the app/static URL for a clip, or None if the cache is not statically served"""
+    audio_dir = os.path.abspath(core.AUDIO_CACHE_DIR)
+    if os.path.commonpath([audio_dir, core.STATIC_DIR]) != core.STATIC_DIR:
         return None
+    relative = os.path.relpath(audio_dir, core.STATIC_DIR).replace(os.sep, "/")
+    return f"{STATIC_URL_PREFIX}/{relative}/{digest}.mp3"
 
-# Simulate translation (in a real app, you would call an API)
-def translate_text(text, source_lang, target_lang, formality):
+# Audio playback helper function
+@AUDIO_PLAYER_SECONDS.time()
+def render_audio_player(text, lang, speech_rate=1.0):
     """
-    Simulate translation - in a real app, this would call an external API
-    like Google Translate, DeepL, etc.
+    Render an audio player for the given text and language. The clip is synthesized
+    once at the normal rate and served as a static file the browser fetches and
+    caches; speech_rate is applied locally with pitch-preserving playback, so
+    changing the rate never re-synthesizes. When the audio cache is not statically
+    served, the clip is embedded with st.audio, which cannot set a playback rate,
+    so it plays at the normal rate.
     """
-    if not text.strip():
-        return ""
+    try:
+        cache = core.get_audio_cache()
+        digest = cache.locate(text, lang, core.BASE_SPEECH_RATE)
+        if digest is None:
+            core.synthesize_speech(text, lang, core.BASE_SPEECH_RATE)
+            digest = cache.digest(text, lang, core.BASE_SPEECH_RATE)
+        url = get_audio_url(digest)
+        if url is not None:
+            st.html(
+                f"""
+                <audio id="tts-{digest[:16]}" controls autoplay src="{url}" style="width: 100%;"></audio>
+                <script>
+                    // Scripts run as globals on the page, so each player's code gets its own scope
+                    (() => {{
+                        const player = document.getElementById("tts-{digest[:16]}");
+                        player.preservesPitch = true;
+                        player.defaultPlaybackRate = player.playbackRate = {float(speech_rate)};
+                    }})();
+                </script>
+                """,
+                unsafe_allow_javascript=True
+            )
+        else:
+            # st.audio has no playback rate, so speech_rate only applies to statically served clips
+            st.audio(core.synthesize_speech(text, lang, core.BASE_SPEECH_RATE), format="audio/mp3", autoplay=True)
+    except Exception as e:
+        st.error(f"Error generating audio: {e}")
+
+# Bulk translations are kept in temporary files until the session releases them
+def remove_file(path):
+    """Delete path if it still exists"""
+    with contextlib.suppress(OSError):
+        os.remove(path)
+
+# Add to translation history
+def add_to_history(source_text, translated_text, source_lang, target_lang):
+    """Add a translation to this session's history and to the profile's persistent history"""
+    core.add_to_history(
+        st.session_state.translation_history, source_text, translated_text,
+        source_lang, target_lang, get_history_user_id()
+    )
+
+# History is persisted per profile; the profile id lives in the URL so a bookmark keeps it
+def get_history_user_id():
+    """Return this browser's history profile id, creating one on first visit"""
+    user_id = st.query_params.get("profile")
+    if not user_id:
+        user_id = uuid.uuid4().hex[:12]
+        st.query_params["profile"] = user_id
+    return user_id
+
+# Load one page of history, from the persistent store when available
+def load_history_page(page, query=""):
+    """Return (entries, has_more) for a zero-based page of the history, filtered by query"""
+    store = core.get_history_store()
+    if store is not None:
+        # One extra row tells whether an older page exists without counting every match
+        entries = store.page(get_history_user_id(), HISTORY_PAGE_SIZE + 1, page * HISTORY_PAGE_SIZE, query)
+    else:
+        history = st.session_state.translation_history
+        if query:
+            terms = query.casefold().split()
+            history = (item for item in history
+                       if all(term in f"{item.source_text} {item.translated_text}".casefold() for term in terms))
+        start = page * HISTORY_PAGE_SIZE
+        entries = list(itertools.islice(history, start, start + HISTORY_PAGE_SIZE + 1))
+    return entries[:HISTORY_PAGE_SIZE], len(entries) > HISTORY_PAGE_SIZE
+
+# Widget callbacks run before the script reruns, so they can update widgets without a second run
+def run_translation():
+    """Translate the whole source text (Translate button)"""
+    source_text = st.session_state.source_text
+    if not source_text:
+        return
     
-    # Check if in offline mode and if we have a cached translation
-    cache_key = f"{text}_{source_lang}_{target_lang}_{formality}"
-    if st.session_state.offline_mode and cache_key in st.session_state.cached_translations:
-        return st.session_state.cached_translations[cache_key]
+    # Long texts are streamed into the translation box by main() instead
+    if st.session_state.stream_translations and len(core.split_sentences(source_text.strip())) > 1:
+        st.session_state.pending_stream = source_text
+        return
     
-    # If in offline mode with no cached translation
-    if st.session_state.offline_mode:
-        return "Translation not available in offline mode. Please connect to translate new text."
-        
-    # Simple dictionary of common phrases in different languages (very limited example)
-    translations = {
-        'en': {
-            'es': {
-                'Hello': 'Hola',
-                'Thank you': 'Gracias',
-                'Please': 'Por favor',
-                'Yes': 'Sí',
-                'No': 'No',
-                'Goodbye': 'Adiós',
-                'Excuse me': 'Disculpe',
-                'Sorry': 'Lo siento',
-                'Where is the bathroom?': '¿Dónde está el baño?',
-                'How much does this cost?': '¿Cuánto cuesta esto?',
-                'I would like to order': 'Me gustaría ordenar',
-                'I need help': 'Necesito ayuda'
-            },
-            'fr': {
-                'Hello': 'Bonjour',
-                'Thank you': 'Merci',
-                'Please': 'S\'il vous plaît',
-                'Yes': 'Oui',
-                'No': 'Non',
-                'Goodbye': 'Au revoir',
-                'Excuse me': 'Excusez-moi',
-                'Sorry': 'Désolé',
-                'Where is the bathroom?': 'Où sont les toilettes?',
-                'How much does this cost?': 'Combien ça coûte?',
-                'I would like to order': 'Je voudrais commander',
-                'I need help': 'J\'ai besoin d\'aide'
-            },
-            'de': {
-                'Hello': 'Hallo',
-                'Thank you': 'Danke',
-                'Please': 'Bitte',
-                'Yes': 'Ja',
-                'No': 'Nein',
-                'Goodbye': 'Auf Wiedersehen',
-                'Excuse me': 'Entschuldigung',
-                'Sorry': 'Es tut mir leid',
-                'Where is the bathroom?': 'Wo ist die Toilette?',
-                'How much does this cost?': 'Wie viel kostet das?',
-                'I would like to order': 'Ich möchte bestellen',
-                'I need help': 'Ich brauche Hilfe'
-            }
-        }
-    }
+    with st.spinner("Translating..."):
+        translated = translate_text(
+            source_text,
+            st.session_state.source_lang,
+            st.session_state.target_lang,
+            st.session_state.formality
+        )
+    st.session_state.translated_text = translated
     
-    # Check if we have a direct translation
-    if source_lang in translations and target_lang in translations[source_lang] and text in translations[source_lang][target_lang]:
-        result = translations[source_lang][target_lang][text]
-    elif source_lang == target_lang:
-        # If source and target are the same, return the original text
-        result = text
-    else:
-        # For other cases, append a prefix to show it's a simulated translation
-        formality_str = "[FORMAL] " if formality else "[CASUAL] "
-        result = f"{formality_str}[Translated from {source_lang} to {target_lang}]: {text}"
+    # Add to history
+    add_to_history(source_text, translated, st.session_state.source_lang, st.session_state.target_lang)
     
-    # Cache the translation
-    st.session_state.cached_translations[cache_key] = result
+    # Save last source to prevent multiple auto-translations
+    st.session_state.last_source = source_text
+
+def run_auto_translation():
+    """Auto-translate after an edit, re-translating only the sentences that changed"""
+    if not st.session_state.auto_translate:
+        return
+    source_text = st.session_state.source_text
+    if not source_text.strip():
+        st.session_state.translated_text = ""
+        st.session_state.last_source = source_text
+        return
     
-    # Simulate API delay
-    time.sleep(0.5)
+    # Sentences translated offline are not reused once back online, and the other way round
+    pair = (st.session_state.source_lang, st.session_state.target_lang, st.session_state.formality,
+            st.session_state.offline_mode)
+    same_pair = st.session_state.get("auto_translate_pair") == pair
+    if same_pair and source_text == st.session_state.get("last_source"):
+        return
     
-    return result
+    # Auto-translate runs on every edit, so it queues behind explicit Translate clicks at the backend
+    with st.spinner("Translating..."), core.backend_priority(core.PRIORITY_AUTO):
+        try:
+            translated, sentences = core.translate_incrementally(
+                source_text, *pair[:3], previous=st.session_state.cached_translations.held("auto_translate_sentences") if same_pair else None,
+                offline=pair[3], session_cache=st.session_state.cached_translations
+            )
+        except core.TranslationBackendError as e:
+            st.error(f"Translation failed: {e}")
+            return
+    st.session_state.translated_text = translated
+    st.session_state.auto_translate_pair = pair
+    # Held in the session cache, so the sentence map counts against the session memory budget
+    st.session_state.cached_translations.hold("auto_translate_sentences", sentences)
+    st.session_state.last_source = source_text
+    add_to_history(source_text, translated, pair[0], pair[1])
 
-# Add to translation history
-def add_to_history(source_text, translated_text, source_lang, target_lang):
-    """Add a translation to the history"""
-    if not source_text.strip() or not translated_text.strip():
+def run_fanout_translation():
+    """Translate the source text into every selected language at once (Translate to All button)"""
+    source_text = st.session_state.source_text
+    source_lang = st.session_state.source_lang
+    target_langs = [lang for lang in st.session_state.fanout_langs if lang != source_lang]
+    if not source_text.strip() or not target_langs:
         return
-        
-    timestamp = datetime.now().isoformat()
     
-    history_item = {
-        "id": int(time.time() * 1000),  # Unique ID based on timestamp
-        "source_text": source_text,
-        "translated_text": translated_text,
-        "source_lang": source_lang,
-        "target_lang": target_lang,
-        "timestamp": timestamp
-    }
+    with st.spinner(f"Translating into {len(target_langs)} languages..."):
+        try:
+            translations = core.translate_fanout(
+                source_text, source_lang, target_langs, st.session_state.formality,
+                st.session_state.offline_mode, st.session_state.cached_translations
+            )
+        except core.TranslationBackendError as e:
+            st.error(f"Translation failed: {e}")
+            return
+    st.session_state.cached_translations.hold("fanout_result", (source_text, source_lang, translations))
     
-    # Add to the beginning of the history list
-    st.session_state.translation_history.insert(0, history_item)
+    for target_lang, translated in translations.items():
+        add_to_history(source_text, translated, source_lang, target_lang)
+
+def clear_source_text():
+    """Empty both text boxes (Clear button)"""
+    st.session_state.source_text = ""
+    st.session_state.translated_text = ""
+    st.session_state.last_source = ""
+
+def swap_languages():
+    """Swap the language pair, and the texts when both are filled in (Swap button)"""
+    source_text = st.session_state.get("source_text", "")
+    translated_text = st.session_state.get("translated_text", "")
     
-    # Keep only the last 50 items
-    if len(st.session_state.translation_history) > 50:
-        st.session_state.translation_history = st.session_state.translation_history[:50]
+    # Swap languages
+    st.session_state.source_lang, st.session_state.target_lang = (
+        st.session_state.target_lang, st.session_state.source_lang
+    )
+    
+    # Swap text if both have content
+    if source_text and translated_text:
+        st.session_state.source_text = translated_text
+        st.session_state.translated_text = source_text
+        st.session_state.last_source = translated_text
 
-# Language code to name mapping
-def get_language_name(lang_code):
-    """Convert language code to full name"""
-    languages = {
-        'en': 'English',
-        'es': 'Spanish',
-        'fr': 'French',
-        'de': 'German',
-        'it': 'Italian',
-        'ja': 'Japanese',
-        'ko': 'Korean',
-        'zh': 'Chinese',
-        'ru': 'Russian',
-        'ar': 'Arabic',
-        'hi': 'Hindi',
-        'pt': 'Portuguese'
-    }
-    return languages.get(lang_code, lang_code)
+def use_phrase(phrase):
+    """Put a phrasebook phrase in the source box, translating it when auto-translate is on"""
+    st.session_state.source_text = phrase
+    run_auto_translation()
+
+def load_history_item(item):
+    """Restore a history entry into the translator (Load button)"""
+    st.session_state.source_text = item.source_text
+    st.session_state.source_lang = item.source_lang
+    st.session_state.target_lang = item.target_lang
+    st.session_state.translated_text = item.translated_text
+    st.session_state.last_source = item.source_text
+
+def clear_history():
+    """Delete this profile's history (Clear History button)"""
+    if st.session_state.translation_history is not None:
+        st.session_state.translation_history.clear()
+    store = core.get_history_store()
+    if store is not None:
+        store.clear(get_history_user_id())
+    st.session_state.history_page = 0
+
+def set_history_page(page):
+    """Show another page of the history"""
+    st.session_state.history_page = page
 
 # Main application
 def main():
@@ -313,38 +372,24 @@ def main():
         with col1:
             source_lang = st.selectbox(
                 "Translate from:", 
-                options=["en", "es", "fr", "de", "it", "ja", "ko", "zh", "ru", "ar", "hi", "pt"],
-                format_func=get_language_name,
-                key="source_lang"
+                options=core.SUPPORTED_LANGUAGES,
+                format_func=core.get_language_name,
+                key="source_lang",
+                on_change=run_auto_translation
             )
         
         with col2:
             st.markdown("<div style='text-align: center; padding-top: 30px;'>")
-            swap_button = st.button("🔄 Swap", use_container_width=True)
+            st.button("🔄 Swap", use_container_width=True, on_click=swap_languages)
             st.markdown("</div>", unsafe_allow_html=True)
-            
-            if swap_button:
-                # Get current values
-                source = st.session_state.source_lang
-                target = st.session_state.target_lang
-                source_text = st.session_state.source_text if "source_text" in st.session_state else ""
-                translated_text = st.session_state.translated_text if "translated_text" in st.session_state else ""
-                
-                # Swap languages
-                st.session_state.source_lang = target
-                st.session_state.target_lang = source
-                
-                # Swap text if both have content
-                if source_text and translated_text:
-                    st.session_state.source_text = translated_text
-                    st.session_state.translated_text = source_text
         
         with col3:
             target_lang = st.selectbox(
                 "Translate to:", 
                 options=["es", "en", "fr", "de", "it", "ja", "ko", "zh", "ru", "ar", "hi", "pt"],
-                format_func=get_language_name,
-                key="target_lang"
+                format_func=core.get_language_name,
+                key="target_lang",
+                on_change=run_auto_translation
             )
         
         # Text input and translation
@@ -352,29 +397,43 @@ def main():
         
         with col1:
             st.markdown("<p class='subheader'>Enter Text</p>", unsafe_allow_html=True)
+            # The text area reports its value on blur or Ctrl+Enter, which debounces auto-translation
             source_text = st.text_area("", height=150, key="source_text", 
-                                       placeholder="Enter text to translate...")
+                                       placeholder="Enter text to translate...",
+                                       on_change=run_auto_translation)
             
             col1_1, col1_2 = st.columns([1, 1])
             with col1_1:
                 if st.button("🔊 Listen", use_container_width=True):
                     if source_text:
-                        audio_player = get_audio_player(source_text, source_lang)
-                        if audio_player:
-                            st.markdown(audio_player, unsafe_allow_html=True)
+                        render_audio_player(source_text, source_lang, st.session_state.speech_rate)
             with col1_2:
-                if st.button("❌ Clear", use_container_width=True):
-                    st.session_state.source_text = ""
-                    st.experimental_rerun()
+                st.button("❌ Clear", use_container_width=True, on_click=clear_source_text)
         
         with col2:
             st.markdown("<p class='subheader'>Translation</p>", unsafe_allow_html=True)
             
             if "translated_text" not in st.session_state:
                 st.session_state.translated_text = ""
-                
+            
+            # Stream a long translation in place before the translation box is created
+            pending_stream = st.session_state.pop("pending_stream", None)
+            if pending_stream:
+                stream_placeholder = st.empty()
+                try:
+                    with stream_placeholder.container():
+                        streamed = st.write_stream(core.iter_translation(
+                            pending_stream, source_lang, target_lang, st.session_state.formality,
+                            st.session_state.offline_mode, st.session_state.cached_translations
+                        ))
+                    st.session_state.translated_text = streamed
+                    add_to_history(pending_stream, streamed, source_lang, target_lang)
+                    st.session_state.last_source = pending_stream
+                except core.TranslationBackendError as e:
+                    st.error(f"Translation failed: {e}")
+                stream_placeholder.empty()
+            
             translated_text = st.text_area("", 
-                                          value=st.session_state.translated_text,
                                           height=150, key="translated_text", 
                                           placeholder="Translation will appear here...",
                                           disabled=True)
@@ -383,9 +442,7 @@ def main():
             with col2_1:
                 if st.button("🔊 Listen Translation", use_container_width=True):
                     if translated_text:
-                        audio_player = get_audio_player(translated_text, target_lang)
-                        if audio_player:
-                            st.markdown(audio_player, unsafe_allow_html=True)
+                        render_audio_player(translated_text, target_lang, st.session_state.speech_rate)
             with col2_2:
                 if st.button("📋 Copy", use_container_width=True):
                     if translated_text:
@@ -403,90 +460,66 @@ def main():
         # Translation button and auto-translate checkbox
         col1, col2 = st.columns([3, 2])
         with col1:
-            translate_button = st.button("🌐 Translate", use_container_width=True)
+            st.button("🌐 Translate", use_container_width=True, on_click=run_translation)
         with col2:
-            auto_translate = st.checkbox("Auto-translate", value=st.session_state.auto_translate)
-            st.session_state.auto_translate = auto_translate
-            
-        # Perform translation when button is clicked or auto-translate is on
-        if translate_button or (auto_translate and source_text and "last_source" not in st.session_state or source_text != st.session_state.get("last_source", "")):
-            if source_text:
-                with st.spinner("Translating..."):
-                    translated = translate_text(
-                        source_text, 
-                        source_lang, 
-                        target_lang, 
-                        st.session_state.formality
-                    )
-                    st.session_state.translated_text = translated
-                    
-                    # Add to history
-                    add_to_history(source_text, translated, source_lang, target_lang)
-                    
-                    # Save last source to prevent multiple auto-translations
-                    st.session_state.last_source = source_text
-                    
-                    # Force refresh
-                    st.experimental_rerun()
+            st.checkbox("Auto-translate", key="auto_translate", on_change=run_auto_translation)
         
         st.markdown('</div>', unsafe_allow_html=True)
     
-    # Tabs for History, Phrasebook, and Settings
-    tab1, tab2, tab3 = st.tabs(["History", "Phrase Book", "Settings"])
+    # Tabs for History, Phrasebook, Bulk translation and Settings
+    tab1, tab2, tab_fanout, tab_bulk, tab3 = st.tabs(
+        ["History", "Phrase Book", "Multi-Language", "Bulk Translate", "Settings"]
+    )
     
     # History tab
-    with tab1:
+    with tab1, HISTORY_RENDER_SECONDS.time():
         st.markdown('<div class="card">', unsafe_allow_html=True)
         
-        if not st.session_state.translation_history:
-            st.info("Your translation history will appear here")
+        history_query = st.text_input("🔍 Search history", key="history_query",
+                                      placeholder="Search source or translated text...")
+        if history_query != st.session_state.get("last_history_query", ""):
+            st.session_state.last_history_query = history_query
+            st.session_state.history_page = 0
+        
+        # Only one page of items is loaded and rendered, however long the history is
+        page = st.session_state.history_page
+        items, has_more = load_history_page(page, history_query)
+        
+        if not items and page == 0:
+            st.info("No translations match your search" if history_query else "Your translation history will appear here")
         else:
-            if st.button("🗑️ Clear History"):
-                st.session_state.translation_history = []
-                st.experimental_rerun()
-                
-            for item in st.session_state.translation_history:
+            st.button("🗑️ Clear History", on_click=clear_history)
+            
+            for item in items:
+                source_preview = item.source_text[:40] + ('...' if len(item.source_text) > 40 else '')
+                translated_preview = item.translated_text[:40] + ('...' if len(item.translated_text) > 40 else '')
                 col1, col2 = st.columns([5, 1])
                 with col1:
-                    # Format the history item
+                    # Format the history item; clicks are handled by the delegated listener in static/js/app.js
                     st.markdown(
-                        f"""
-                        <div class="history-item" onclick="loadHistoryItem{item['id']}()">
-                            <div style="display: flex; justify-content: space-between;">
-                                <span style="color: #3949ab;">
-                                    {get_language_name(item['source_lang'])} → {get_language_name(item['target_lang'])}
-                                </span>
-                                <small style="color: #888;">
-                                    {datetime.fromisoformat(item['timestamp']).strftime('%Y-%m-%d %H:%M')}
-                                </small>
-                            </div>
-                            <div><b>{item['source_text'][:40] + ('...' if len(item['source_text']) > 40 else '')}</b></div>
-                            <div>{item['translated_text'][:40] + ('...' if len(item['translated_text']) > 40 else '')}</div>
-                        </div>
-                        <script>
-                        function loadHistoryItem{item['id']}() {{
-                            const sourceElem = document.querySelector('[data-testid="stTextArea"] textarea[aria-label=""]');
-                            if (sourceElem) {{
-                                sourceElem.value = "{item['source_text'].replace('"', '\\"')}";
-                                sourceElem.dispatchEvent(new Event('input', {{ bubbles: true }}));
-                            }}
-                            
-                            // Also need to update session state - this requires a form submit or similar
-                            // For simplicity, we'll just tell the user we've loaded the text
-                        }}
-                        </script>
-                        """,
+                        f'<div class="history-item" data-source="{html.escape(item.source_text).replace(chr(10), "&#10;")}">'
+                        f'<div class="history-meta"><span class="history-langs">'
+                        f'{core.get_language_name(item.source_lang)} → {core.get_language_name(item.target_lang)}</span>'
+                        f'<small class="history-time">{item.display_time}</small></div>'
+                        f'<div><b>{html.escape(source_preview)}</b></div><div>{html.escape(translated_preview)}</div></div>',
                         unsafe_allow_html=True
                     )
                 with col2:
-                    if st.button("Load", key=f"load_{item['id']}"):
-                        st.session_state.source_text = item['source_text']
-                        st.session_state.source_lang = item['source_lang']
-                        st.session_state.target_lang = item['target_lang']
-                        st.session_state.translated_text = item['translated_text']
-                        st.experimental_rerun()
+                    st.button("Load", key=f"load_{item.id}", on_click=load_history_item, args=(item,))
                 
                 st.markdown("<hr style='margin: 0.5rem 0;'>", unsafe_allow_html=True)
+            
+            # Pagination controls
+            if page > 0 or has_more:
+                prev_col, info_col, next_col = st.columns([1, 2, 1])
+                with prev_col:
+                    st.button("◀ Newer", disabled=page == 0, use_container_width=True,
+                              on_click=set_history_page, args=(page - 1,))
+                with info_col:
+                    st.caption(f"Page {page + 1}")
+                with next_col:
+                    st.button("Older ▶", disabled=not has_more, use_container_width=True,
+                              on_click=set_history_page, args=(page + 1,))
         
         st.markdown('</div>', unsafe_allow_html=True)
     
@@ -494,42 +527,106 @@ def main():
     with tab2:
         st.markdown('<div class="card">', unsafe_allow_html=True)
         
-        # Categories for the phrasebook
-        categories = {
-            "Greetings & Basics": [
-                "Hello", "Thank you", "Please", "Yes", "No", 
-                "Goodbye", "Excuse me", "Sorry"
-            ],
-            "Travel & Directions": [
-                "Where is the bathroom?", "How do I get to the hotel?", 
-                "I am lost", "Can you show me on the map?", 
-                "How much is a taxi to the airport?", "Is it far from here?"
-            ],
-            "Food & Dining": [
-                "I would like to order", "The check, please", 
-                "I am allergic to", "Is there a vegetarian option?", 
-                "Water, please", "This is delicious"
-            ],
-            "Emergency & Health": [
-                "I need help", "Call an ambulance", "I need a doctor", 
-                "I have lost my passport", "Where is the nearest pharmacy?", 
-                "I am not feeling well"
-            ]
-        }
-        
         # Create expandable sections for each category
-        for category, phrases in categories.items():
+        for category, items in get_phrasebook_items().items():
             with st.expander(category, expanded=(category == "Greetings & Basics")):
                 cols = st.columns(2)
-                for i, phrase in enumerate(phrases):
+                for i, (phrase, phrase_html, use_key, listen_key) in enumerate(items):
                     with cols[i % 2]:
-                        st.markdown(f'<div class="phrase-item">{phrase}</div>', unsafe_allow_html=True)
-                        if st.button("Use", key=f"phrase_{phrase.replace(' ', '_')}", use_container_width=True):
-                            st.session_state.source_text = phrase
-                            if st.session_state.auto_translate:
-                                # Trigger translation
-                                st.session_state.last_source = None
-                            st.experimental_rerun()
+                        st.markdown(phrase_html, unsafe_allow_html=True)
+                        use_col, listen_col = st.columns([3, 1])
+                        with use_col:
+                            st.button("Use", key=use_key, use_container_width=True,
+                                      on_click=use_phrase, args=(phrase,))
+                        with listen_col:
+                            listen_phrase = st.button("🔊", key=listen_key, use_container_width=True)
+                        if listen_phrase:
+                            # Phrasebook clips are pre-rendered, so this plays from the audio cache
+                            spoken = core.get_phrase_index().lookup(phrase, "en", target_lang) or phrase
+                            render_audio_player(spoken, target_lang if spoken != phrase else "en", st.session_state.speech_rate)
+        
+        st.markdown('</div>', unsafe_allow_html=True)
+    
+    # Multi-language tab: one text translated into several languages side by side
+    with tab_fanout:
+        st.markdown('<div class="card">', unsafe_allow_html=True)
+        st.markdown("<p class='subheader'>Translate into Several Languages</p>", unsafe_allow_html=True)
+        st.caption(
+            f"Translate the text above from {core.get_language_name(source_lang)} into every selected "
+            f"language at once; all of them take about as long as one translation."
+        )
+        
+        st.multiselect("Target languages", options=core.SUPPORTED_LANGUAGES,
+                       format_func=core.get_language_name, key="fanout_langs")
+        st.button("🌐 Translate to All", use_container_width=True, on_click=run_fanout_translation)
+        
+        fanout_result = st.session_state.cached_translations.held("fanout_result")
+        if fanout_result:
+            fanout_source, fanout_source_lang, translations = fanout_result
+            st.caption(f"From {core.get_language_name(fanout_source_lang)}: {fanout_source[:80]}"
+                       f"{'...' if len(fanout_source) > 80 else ''}")
+            cols = st.columns(3)
+            for i, (lang, translated) in enumerate(translations.items()):
+                with cols[i % 3]:
+                    st.markdown(
+                        f'<div class="fanout-result"><b class="fanout-lang">{core.get_language_name(lang)}</b>'
+                        f'{html.escape(translated)}</div>',
+                        unsafe_allow_html=True
+                    )
+                    if st.button("🔊 Listen", key=f"fanout_listen_{lang}", use_container_width=True):
+                        render_audio_player(translated, lang, st.session_state.speech_rate)
+        
+        st.markdown('</div>', unsafe_allow_html=True)
+    
+    # Bulk file translation tab
+    with tab_bulk:
+        st.markdown('<div class="card">', unsafe_allow_html=True)
+        st.markdown("<p class='subheader'>Translate a File</p>", unsafe_allow_html=True)
+        st.caption(
+            f"Upload a TXT file (one text per line) or a CSV file to translate it from "
+            f"{core.get_language_name(source_lang)} to {core.get_language_name(target_lang)}."
+        )
+        
+        uploaded_file = st.file_uploader("File to translate", type=["csv", "txt"], key="bulk_file")
+        if uploaded_file is not None:
+            column = None
+            if uploaded_file.name.lower().endswith(".csv"):
+                # Only the header line is read to offer the column choice
+                header_line = uploaded_file.getvalue().split(b"\n", 1)[0].decode("utf-8-sig", errors="replace")
+                header = next(csv.reader([header_line]), [])
+                column = st.selectbox("Column to translate", options=header) if header else None
+            
+            if st.button("🌐 Translate File", use_container_width=True):
+                progress = st.progress(0.0, text="Starting...")
+                
+                def report_progress(lines_done, fraction):
+                    progress.progress(fraction, text=f"Translated {lines_done} lines")
+                
+                # The translation is written to a temporary file, so only its path stays in the session
+                stem, extension = os.path.splitext(uploaded_file.name)
+                fd, path = tempfile.mkstemp(prefix="translator-bulk-", suffix=extension)
+                try:
+                    with open(fd, "w", encoding="utf-8", newline="") as output:
+                        core.translate_file(
+                            uploaded_file, source_lang, target_lang, st.session_state.formality,
+                            column=column, on_progress=report_progress, offline=st.session_state.offline_mode,
+                            output=output
+                        )
+                    st.session_state.cached_translations.hold(
+                        "bulk_result", (f"{stem}_{target_lang}{extension}", path),
+                        on_release=functools.partial(remove_file, path)
+                    )
+                    progress.progress(1.0, text="Done")
+                except (core.TranslationBackendError, UnicodeDecodeError, csv.Error) as e:
+                    remove_file(path)
+                    st.error(f"Could not translate file: {e}")
+        
+        bulk_result = st.session_state.cached_translations.held("bulk_result")
+        if bulk_result and os.path.exists(bulk_result[1]):
+            file_name, path = bulk_result
+            with open(path, "rb") as data:
+                st.download_button("⬇️ Download Translation", data=data, file_name=file_name,
+                                   use_container_width=True)
         
         st.markdown('</div>', unsafe_allow_html=True)
     
@@ -539,15 +636,9 @@ def main():
         
         # Display settings
         st.markdown("<p class='subheader'>Display Settings</p>", unsafe_allow_html=True)
-        dark_mode = st.checkbox("Dark Mode", value=st.session_state.dark_mode)
-        if dark_mode != st.session_state.dark_mode:
-            st.session_state.dark_mode = dark_mode
-            st.experimental_rerun()
-            
-        offline_mode = st.checkbox("Offline Mode", value=st.session_state.offline_mode)
-        if offline_mode != st.session_state.offline_mode:
-            st.session_state.offline_mode = offline_mode
-            st.experimental_rerun()
+        # Keyed widgets update session state before the rerun starts, so no extra rerun is needed
+        st.checkbox("Dark Mode", key="dark_mode")
+        st.checkbox("Offline Mode", key="offline_mode")
         
         # Speech settings
         st.markdown("<p class='subheader'>Speech Settings</p>", unsafe_allow_html=True)
@@ -565,51 +656,56 @@ def main():
         st.markdown("<p class='subheader'>Translation Settings</p>", unsafe_allow_html=True)
         formality = st.checkbox("Formal Language", value=st.session_state.formality)
         st.session_state.formality = formality
+        st.checkbox("Stream long translations", key="stream_translations",
+                    help="Show each sentence as soon as it is translated")
         
         # Data management
         st.markdown("<p class='subheader'>Data Management</p>", unsafe_allow_html=True)
         if st.button("Clear Cached Translations"):
-            st.session_state.cached_translations = {}
+            st.session_state.cached_translations.clear()
             st.success("Cached translations cleared!")
         
-        st.markdown('</div>', unsafe_allow_html=True)
-    
-    # Features section
-    st.markdown('<div class="card">', unsafe_allow_html=True)
-    st.markdown("<p class='subheader'>Features</p>", unsafe_allow_html=True)
-    
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        st.markdown(
-            """
-            <div class="feature-card">
-                <h5>Modern Translation</h5>
-                <small>Leveraging AI for accurate language translations</small>
-            </div>
-            """, 
-            unsafe_allow_html=True
+        cache_stats = core.get_translation_cache().stats()
+        st.caption(
+            f"Shared cache: {cache_stats['entries']}/{cache_stats['max_entries']} entries, "
+            f"{cache_stats['hits']} hits, {cache_stats['misses']} misses "
+            f"({cache_stats['hit_rate']:.0%} hit rate)"
         )
-    with col2:
-        st.markdown(
-            """
-            <div class="feature-card">
-                <h5>Travel Ready</h5>
-                <small>Common phrases and offline capabilities for travelers</small>
-            </div>
-            """, 
-            unsafe_allow_html=True
+        audio_stats = core.get_audio_cache().stats()
+        st.caption(
+            f"Audio cache: {audio_stats['entries']} clips in memory "
+            f"({audio_stats['memory_bytes'] / 1024 / 1024:.1f} MB), "
+            f"{audio_stats['memory_hits'] + audio_stats['disk_hits']} hits, {audio_stats['misses']} misses "
+            f"({audio_stats['hit_rate']:.0%} hit rate)"
         )
-    with col3:
-        st.markdown(
-            """
-            <div class="feature-card">
-                <h5>Text-to-Speech</h5>
-                <small>Hear the correct pronunciation with native speakers</small>
-            </div>
-            """, 
-            unsafe_allow_html=True
+        session_cache = st.session_state.cached_translations
+        session_stats = core.get_session_registry().stats()
+        st.caption(
+            f"Session cache: {len(session_cache)} entries ({session_cache.nbytes / 1024:.0f} of "
+            f"{session_cache.max_bytes / 1024:.0f} KB); all {session_stats['sessions']} sessions: "
+            f"{session_stats['bytes'] / 1024 / 1024:.1f} of {session_stats['budget_bytes'] / 1024 / 1024:.0f} MB"
         )
+        backend_states = []
+        for scheduler in core.get_schedulers():
+            stats = scheduler.stats()
+            backend_states.append(
+                f"{scheduler.name} circuit {stats['state']}, {stats['active']} running, {stats['queued']} queued"
+            )
+        st.caption("Backends: " + "; ".join(backend_states))
+
+        # Diagnostics: timings and counters of this server process
+        if st.checkbox("Show diagnostics", key="show_diagnostics",
+                       help="Latency histograms and counters collected by this server process"):
+            st.table(metrics.REGISTRY.latency_table())
+            st.table(metrics.REGISTRY.value_table())
+            st.download_button("⬇️ Download metrics (Prometheus text)", data=metrics.REGISTRY.render(),
+                               file_name="translator-metrics.prom", mime="text/plain")
+        
+        st.markdown('</div>', unsafe_allow_html=True)
     
+    # Features section
+    st.markdown('<div class="card">', unsafe_allow_html=True)
+    st.markdown(FEATURES_HTML, unsafe_allow_html=True)
     st.markdown('</div>', unsafe_allow_html=True)
     
     # Footer
@@ -624,4 +720,5 @@ def main():
 
 # Run the app
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with RERUN_SECONDS.time():
+        main()
\ No newline at end of file
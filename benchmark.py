@@ -0,0 +1,467 @@
+"""
+Benchmarks and load tests for the translation, history and text-to-speech paths.
+
+Translations go through the HTTP backend to the local stub server (stub_server.py)
+and speech comes from the simulated TTS backend, so runs are repeatable and need no
+network. Every run starts from empty stores and caches in a temporary directory.
+
+    python benchmark.py                               # every workload, saved to benchmark-results.json
+    python benchmark.py --only translate tts          # workloads whose names start with these prefixes
+    python benchmark.py --compare baseline.json       # show the change against an earlier run
+    python benchmark.py --compare baseline.json --max-regression 20   # exit 1 on a >20% regression
+    python benchmark.py --only startup                # startup-time report: cold imports and first run
+
+Each workload reports p50/p95/p99 latency per operation, throughput and the peak
+resident memory of the process when it finished. --trace-memory adds the peak Python
+allocations of each workload (tracemalloc), at the cost of slower, less comparable timings.
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import stub_server
+
+# Vocabulary for generated free text
+WORDS = (
+    "train station ticket hotel room museum bridge river market coffee breakfast "
+    "north south left right tomorrow tonight morning late early open closed street "
+    "airport gate luggage passport taxi bus map beach mountain dinner table window"
+).split()
+
+# Module under test, imported once the environment points it at the stub backends
+core = None
+
+# Modules that are expensive to import and should only load when a feature needs them
+HEAVY_MODULES = ("pandas", "numpy", "pyarrow", "requests", "urllib3", "gtts")
+
+# Startup probes, each run in a fresh interpreter: the code is timed, the check exits with an
+# error if the run did not do its job, then peak RSS and heavy modules are reported
+STARTUP_PROBES = {
+    "startup/import-core": ("", "import translator_core", ""),
+    # One headless run of the whole script: everything a new worker does before its first page is sent.
+    # A script that fails to compile renders nothing without raising, so compile it to report why
+    "startup/first-run": (
+        "from streamlit.testing.v1 import AppTest",
+        "at = AppTest.from_file('app.py', default_timeout=120).run()",
+        "if at.exception:\n"
+        "    sys.exit(f'app.py raised: {at.exception[0].message}')\n"
+        "if not at.main.children:\n"
+        "    compile(open('app.py', encoding='utf-8').read(), 'app.py', 'exec')\n"
+        "    sys.exit('app.py rendered nothing')",
+    ),
+}
+STARTUP_PROBE_TEMPLATE = """
+import json, logging, resource, sys, time
+logging.disable(logging.WARNING)
+{setup}
+start = time.perf_counter()
+{code}
+seconds = time.perf_counter() - start
+{check}
+print(json.dumps({{
+    "seconds": seconds,
+    "rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "modules": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+
+def sentence(rng):
+    """Return a random free-text sentence that is not in the phrasebook"""
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 12))).capitalize() + "."
+
+
+def percentile(sorted_values, fraction):
+    """Return the value at fraction (0..1) of sorted_values, interpolating between neighbours"""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def peak_rss_mb():
+    """Return the peak resident set size of this process in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def measure(operation, items, concurrency=1, items_per_op=1):
+    """Run operation(item) for every item on concurrency threads and summarize the latencies"""
+    def timed(item):
+        start = time.perf_counter()
+        operation(item)
+        return time.perf_counter() - start
+
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+        baseline_bytes = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    if concurrency == 1:
+        latencies = [timed(item) for item in items]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(timed, items))
+    elapsed = time.perf_counter() - start
+
+    result = summarize(latencies, elapsed, concurrency, items_per_op)
+    if tracing:
+        peak_bytes = tracemalloc.get_traced_memory()[1] - baseline_bytes
+        result["peak_traced_mb"] = round(max(peak_bytes, 0) / 1024 / 1024, 3)
+    return result
+
+
+def summarize(latencies, elapsed, concurrency=1, items_per_op=1):
+    """Return latency percentiles and throughput for a list of per-operation durations in seconds"""
+    latencies = sorted(latencies)
+    return {
+        "ops": len(latencies),
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 4),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "throughput_ops": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "throughput_items": round(len(latencies) * items_per_op / elapsed, 2) if elapsed else 0.0,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def reset_translation_caches():
+    """Empty the in-process translation tiers and the persistent store, so the next lookups are cold"""
+    core.get_translation_cache().clear()
+    core.get_translation_memory().clear()
+    store = core.get_translation_store()
+    if store is not None:
+        store.clear()
+
+
+def play_speech(text, lang):
+    """Do the server-side work of the app's Listen button: locate the clip or synthesize it"""
+    cache = core.get_audio_cache()
+    if cache.locate(text, lang, core.BASE_SPEECH_RATE) is None:
+        core.synthesize_speech(text, lang, core.BASE_SPEECH_RATE)
+
+
+def translation_workloads(args, rng):
+    targets = [lang for lang in core.SUPPORTED_LANGUAGES if lang != "en"]
+    phrase_index = core.get_phrase_index()
+    phrases = [phrase for items in phrase_index.categories.values() for phrase in items]
+
+    free_text = [(sentence(rng), rng.choice(targets)) for _ in range(args.ops)]
+    phrase_jobs = [(rng.choice(phrases), rng.choice(targets)) for _ in range(args.ops)]
+    paragraphs = [(" ".join(sentence(rng) for _ in range(5)), rng.choice(targets))
+                  for _ in range(max(args.ops // 5, 1))]
+
+    def translate(job):
+        core.translate_text(job[0], "en", job[1], True)
+
+    def translate_batch(texts):
+        core.translate_batch(texts, "en", "es", True)
+
+    def translate_fanout(job):
+        core.translate_fanout(job[0], "en", targets, True)
+
+    reset_translation_caches()
+    yield "translate/cold/free-text", lambda: measure(translate, free_text)
+    yield "translate/warm/free-text", lambda: measure(translate, free_text)
+    yield "translate/cold/phrasebook", lambda: measure(translate, phrase_jobs)
+    yield "translate/warm/phrasebook", lambda: measure(translate, phrase_jobs)
+    yield "translate/cold/paragraph", lambda: measure(translate, paragraphs)
+    yield "translate/warm/paragraph", lambda: measure(translate, paragraphs)
+
+    # Every paragraph into all eleven other languages at once; compare with translate/*/paragraph
+    reset_translation_caches()
+    yield "fanout/cold/paragraph", lambda: measure(translate_fanout, paragraphs)
+    yield "fanout/warm/paragraph", lambda: measure(translate_fanout, paragraphs)
+
+    for size in args.batch_sizes:
+        batches = [[sentence(rng) for _ in range(size)] for _ in range(max(args.ops // size, 3))]
+        reset_translation_caches()
+        yield f"batch/cold/{size}", lambda: measure(translate_batch, batches, items_per_op=size)
+        yield f"batch/warm/{size}", lambda: measure(translate_batch, batches, items_per_op=size)
+
+
+def history_workloads(args, rng):
+    store = core.get_history_store()
+    now = datetime.now()
+    for length in args.history_sizes:
+        user_id = f"bench-{length}"
+        store.add_rows(
+            (user_id, sentence(rng), sentence(rng), "en", "es", (now - timedelta(seconds=length - i)).timestamp())
+            for i in range(length)
+        )
+        history = deque(maxlen=core.HISTORY_MAX_ITEMS)
+        additions = [(sentence(rng), sentence(rng)) for _ in range(args.ops)]
+        pages = list(range(args.ops))
+        queries = [rng.choice(WORDS) for _ in range(args.ops)]
+
+        def add(texts):
+            core.add_to_history(history, texts[0], texts[1], "en", "es", user_id)
+
+        yield f"history/add/{length}", lambda: measure(add, additions)
+        yield f"history/first-page/{length}", lambda: measure(lambda _: store.page(user_id, 10), pages)
+        yield f"history/deep-page/{length}", lambda: measure(lambda _: store.page(user_id, 10, length // 2), pages)
+        yield f"history/search/{length}", lambda: measure(lambda query: store.page(user_id, 10, 0, query), queries)
+
+
+def speech_workloads(args, rng):
+    clips = [(sentence(rng), rng.choice(core.SUPPORTED_LANGUAGES)) for _ in range(args.ops)]
+
+    def listen(job):
+        play_speech(*job)
+
+    def synthesize(job):
+        core.synthesize_speech(job[0], job[1], core.BASE_SPEECH_RATE)
+
+    def from_disk():
+        # A fresh cache has an empty memory tier, so every clip is read back from disk
+        core.get_audio_cache.clear()
+        return measure(synthesize, clips)
+
+    yield "tts/cold", lambda: measure(listen, clips)
+    yield "tts/warm", lambda: measure(synthesize, clips)
+    yield "tts/warm-disk", from_disk
+    yield "tts/listen-cached", lambda: measure(listen, clips)
+
+
+def session_workloads(args, rng):
+    phrase_index = core.get_phrase_index()
+    phrases = [phrase for items in phrase_index.categories.values() for phrase in items]
+
+    for sessions in args.sessions:
+        # Like the app: bounded session caches, and no in-memory history copy when the history store is on
+        histories = [deque(maxlen=core.HISTORY_MAX_ITEMS) if core.get_history_store() is None else None
+                     for _ in range(sessions)]
+        session_caches = [core.SessionCache() for _ in range(sessions)]
+        # Each interaction: translate a phrase or a new sentence, record it, and listen to it
+        steps = [(i % sessions, rng.random() < 0.5, rng.choice(phrases), sentence(rng), rng.choice(["es", "fr", "de"]))
+                 for i in range(args.ops)]
+
+        def interact(step):
+            session, use_phrase, phrase, text, target = step
+            source = phrase if use_phrase else text
+            translation = core.translate_text(source, "en", target, True, session_cache=session_caches[session])
+            core.add_to_history(histories[session], source, translation, "en", target, f"session-{session}")
+            play_speech(translation, target)
+
+        yield f"sessions/{sessions}", lambda: measure(interact, steps, concurrency=sessions)
+
+    for sessions in args.sessions:
+        # Group-tour burst: every session asks for the same new sentence and its audio at the same moment
+        bursts = [(sentence(rng), rng.choice(["es", "fr", "de"])) for _ in range(max(args.ops // sessions, 3))]
+        steps = [job for job in bursts for _ in range(sessions)]
+
+        def burst_step(job):
+            translation = core.translate_text(job[0], "en", job[1], True)
+            play_speech(translation, job[1])
+
+        def run_burst():
+            before = sum(core.COALESCED_CALLS.value(kind=kind) for kind in ("translation", "speech"))
+            result = measure(burst_step, steps, concurrency=sessions)
+            result["coalesced_calls"] = sum(core.COALESCED_CALLS.value(kind=kind) for kind in ("translation", "speech")) - before
+            return result
+
+        yield f"sessions/burst/{sessions}", run_burst
+
+    # Interactive translations while bulk jobs keep every backend slot busy; bulk work queues behind them
+    bulk_jobs = 16
+    interactive = [(sentence(rng), rng.choice(["es", "fr", "de"])) for _ in range(args.ops)]
+    bulk_texts = [sentence(rng) for _ in range(args.ops * 20)]
+
+    def run_mixed():
+        stop = threading.Event()
+        bulk_done = []
+
+        def bulk(worker):
+            for text in bulk_texts[worker::bulk_jobs]:
+                if stop.is_set():
+                    break
+                core.translate_batch([text], "en", "it", True)
+                bulk_done.append(text)
+
+        workers = [threading.Thread(target=bulk, args=(worker,)) for worker in range(bulk_jobs)]
+        for worker in workers:
+            worker.start()
+        time.sleep(0.1)
+        result = measure(lambda job: core.translate_text(job[0], "en", job[1], True), interactive, concurrency=4)
+        stop.set()
+        for worker in workers:
+            worker.join()
+        result["bulk_texts"] = len(bulk_done)
+        return result
+
+    yield "sessions/mixed", run_mixed
+
+
+def startup_workloads(args, rng):
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name, (setup, code, check) in STARTUP_PROBES.items():
+        def run(setup=setup, code=code, check=check):
+            source = STARTUP_PROBE_TEMPLATE.format(setup=setup, code=code, check=check, heavy=HEAVY_MODULES)
+            samples = []
+            for _ in range(args.startup_runs):
+                completed = subprocess.run([sys.executable, "-c", source], cwd=directory,
+                                           capture_output=True, text=True)
+                if completed.returncode != 0:
+                    error = (completed.stderr.strip().splitlines() or ["failed"])[-1]
+                    return {"error": error}
+                samples.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+            result = summarize([sample["seconds"] for sample in samples], sum(sample["seconds"] for sample in samples))
+            rss_kb = sorted(sample["rss_kb"] for sample in samples)[len(samples) // 2]
+            result["peak_rss_mb"] = round(rss_kb / 1024 / (1024 if sys.platform == "darwin" else 1), 1)
+            result["heavy_modules"] = samples[-1]["modules"]
+            return result
+
+        yield name, run
+
+
+# Workload generators yield (name, run) pairs in order; warm workloads reuse the caches filled by cold ones
+WORKLOAD_GROUPS = (
+    (("translate/", "fanout/", "batch/"), translation_workloads),
+    (("history/",), history_workloads),
+    (("tts/",), speech_workloads),
+    (("sessions/",), session_workloads),
+    (("startup/",), startup_workloads),
+)
+
+
+def overlaps(name, prefixes):
+    """Whether a workload name (or name prefix) can match one of the --only prefixes"""
+    return prefixes is None or any(name.startswith(prefix) or prefix.startswith(name) for prefix in prefixes)
+
+
+def git_revision():
+    """Return the current git commit of the checkout, or None"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, max_regression=None):
+    """Print the change of each workload against a baseline file; return the regressed workload names"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    regressions = []
+    print(f"\n{'workload':32} {'p95 ms':>21} {'throughput ops/s':>27}")
+    for name, current in results.items():
+        before = baseline.get(name)
+        if before is None or "error" in before or "error" in current:
+            continue
+        p95_change = (current["p95_ms"] / before["p95_ms"] - 1) * 100 if before["p95_ms"] else 0.0
+        rate_change = (current["throughput_ops"] / before["throughput_ops"] - 1) * 100 if before["throughput_ops"] else 0.0
+        print(f"{name:32} {before['p95_ms']:8.2f} → {current['p95_ms']:8.2f} ({p95_change:+5.0f}%) "
+              f"{before['throughput_ops']:9.1f} → {current['throughput_ops']:9.1f} ({rate_change:+5.0f}%)")
+        if max_regression is not None and (p95_change > max_regression or rate_change < -max_regression):
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the translation, history and speech paths")
+    parser.add_argument("--only", nargs="+", metavar="PREFIX", help="Run only workloads starting with these prefixes")
+    parser.add_argument("--ops", type=int, default=200, help="Operations per workload")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--history-sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 8, 32], help="Concurrent simulated sessions")
+    parser.add_argument("--backend-delay", type=float, default=0.02, help="Stub translation API latency in seconds")
+    parser.add_argument("--tts-delay", type=float, default=0.02, help="Simulated speech synthesis latency in seconds")
+    parser.add_argument("--startup-runs", type=int, default=5, help="Fresh interpreters started per startup probe")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Also record peak Python allocations per workload (slows every operation)")
+    parser.add_argument("-o", "--output", default="benchmark-results.json", help="Where to save the JSON results")
+    parser.add_argument("--compare", metavar="BASELINE", help="Earlier results file to compare against")
+    parser.add_argument("--max-regression", type=float, metavar="PERCENT",
+                        help="With --compare, exit 1 if p95 grows or throughput drops by more than this")
+    args = parser.parse_args()
+
+    server = stub_server.make_server(delay=args.backend_delay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    workdir = tempfile.TemporaryDirectory(prefix="translator-bench-")
+    os.environ.update({
+        "TRANSLATOR_BACKEND": "http",
+        "TRANSLATOR_API_URL": f"http://127.0.0.1:{server.server_address[1]}/translate",
+        "TRANSLATOR_TTS_BACKEND": "simulated",
+        "TRANSLATOR_SIMULATED_TTS_DELAY": str(args.tts_delay),
+        # The speech rate limit protects gTTS; the simulated synthesizer needs no protection
+        "TRANSLATOR_TTS_RATE": "0",
+        "TRANSLATOR_STORE_PATH": os.path.join(workdir.name, "translations.db"),
+        "TRANSLATOR_HISTORY_PATH": os.path.join(workdir.name, "history.db"),
+        "TRANSLATOR_AUDIO_CACHE_DIR": os.path.join(workdir.name, "audio"),
+    })
+    logging.basicConfig(level=logging.WARNING)
+    global core
+    core = importlib.import_module("translator_core")
+
+    rng = random.Random(args.seed)
+    results = {}
+    if args.trace_memory:
+        tracemalloc.start()
+    try:
+        for group_prefixes, group in WORKLOAD_GROUPS:
+            if not any(overlaps(prefix, args.only) for prefix in group_prefixes):
+                continue
+            for name, run in group(args, rng):
+                if args.only is None or name.startswith(tuple(args.only)):
+                    result = results[name] = run()
+                elif "/cold" in name and overlaps(name.replace("/cold", "/warm"), args.only):
+                    run()  # Fills the caches a selected warm workload reads from
+                    continue
+                else:
+                    continue
+                if "error" in result:
+                    print(f"{name:32} failed: {result['error']}", flush=True)
+                    continue
+                print(f"{name:32} p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  "
+                      f"p99 {result['p99_ms']:8.2f} ms  {result['throughput_ops']:9.1f} ops/s  "
+                      f"rss {result['peak_rss_mb']:7.1f} MB", flush=True)
+    finally:
+        tracemalloc.stop()
+        server.shutdown()
+        workdir.cleanup()
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "max_rss_mb": round(peak_rss_mb(), 1),
+            "settings": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved results to {args.output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.max_regression)
+        if regressions:
+            sys.exit(f"Regressions: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
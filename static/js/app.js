@@ -0,0 +1,31 @@
+// Page behaviour of the translator, loaded once per browser tab and cached by the browser.
+// The app renders it with st.html on every run, so everything here must be idempotent.
+(function () {
+    if (window.translatorUi) {
+        return;
+    }
+    window.translatorUi = true;
+
+    // The app passes the versioned stylesheet URL, so a changed stylesheet is fetched again
+    const link = document.createElement("link");
+    link.rel = "stylesheet";
+    link.href = document.currentScript.dataset.stylesheet;
+    document.head.appendChild(link);
+
+    // Clicking a history item copies its source text into the source box. One delegated
+    // listener serves every item, including the ones rendered by later runs.
+    document.addEventListener("click", function (event) {
+        const item = event.target.closest(".history-item[data-source]");
+        if (!item) {
+            return;
+        }
+        const source = document.querySelector('[data-testid="stTextArea"] textarea[aria-label=""]:not([disabled])');
+        if (source) {
+            // React tracks the value through the native setter, so assigning .value alone is ignored
+            const setValue = Object.getOwnPropertyDescriptor(HTMLTextAreaElement.prototype, "value").set;
+            setValue.call(source, item.dataset.source);
+            source.dispatchEvent(new Event("input", { bubbles: true }));
+            source.focus();
+        }
+    });
+})();
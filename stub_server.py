@@ -0,0 +1,105 @@
+"""
+Local stand-in for a LibreTranslate-compatible translation API.
+
+Run it with `python stub_server.py --port 5001 --delay 0.5` and start the app with
+TRANSLATOR_BACKEND=http TRANSLATOR_API_URL=http://127.0.0.1:5001/translate
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubTranslationHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections open, so pooled clients can reuse them
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without TCP_NODELAY the body waits for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def setup(self):
+        super().setup()
+        with self.server.stats_lock:
+            self.server.stats["connections"] += 1
+
+    def do_GET(self):
+        if self.path == "/stats":
+            with self.server.stats_lock:
+                self.send_json(200, dict(self.server.stats))
+        else:
+            self.send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if self.path != "/translate":
+            self.send_json(404, {"error": "Not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            texts = payload["q"]
+            source_lang = payload["source"]
+            target_lang = payload["target"]
+        except (ValueError, KeyError) as e:
+            self.send_json(400, {"error": f"Invalid request: {e}"})
+            return
+
+        with self.server.stats_lock:
+            self.server.stats["requests"] += 1
+            self.server.stats["texts"] += len(texts) if isinstance(texts, list) else 1
+
+        time.sleep(self.server.delay)
+        prefix = "[FORMAL] " if payload.get("formality") != "informal" else "[CASUAL] "
+
+        def translate(text):
+            if source_lang == target_lang:
+                return text
+            return f"{prefix}[Translated from {source_lang} to {target_lang}]: {text}"
+
+        if isinstance(texts, list):
+            self.send_json(200, {"translatedText": [translate(text) for text in texts]})
+        else:
+            self.send_json(200, {"translatedText": translate(texts)})
+
+
+def make_server(host="127.0.0.1", port=0, delay=0.0, quiet=True):
+    """Create a threaded stub server; port 0 picks a free port (see server.server_address)"""
+    server = ThreadingHTTPServer((host, port), StubTranslationHandler)
+    server.daemon_threads = True
+    server.delay = delay
+    server.quiet = quiet
+    server.stats = {"connections": 0, "requests": 0, "texts": 0}
+    server.stats_lock = threading.Lock()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local stub translation API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--delay", type=float, default=0.5, help="Simulated latency per request in seconds")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.delay, quiet=False)
+    print(f"Stub translation API listening on http://{args.host}:{server.server_address[1]}/translate")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
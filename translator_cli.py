@@ -0,0 +1,216 @@
+"""
+Command line interface to translator_core, sharing its caches and stores with the
+Streamlit app and the HTTP service.
+
+    python translator_cli.py translate "Where is the station?" --source en --target es
+    python translator_cli.py batch phrases.csv --column text --source en --target de -o phrases_de.csv
+    python translator_cli.py speak "¿Dónde está la estación?" --lang es -o station.mp3
+    python translator_cli.py history --profile 3f2a9c1b7d4e --search station
+    python translator_cli.py serve --port 8080
+    python translator_cli.py prerender-audio [--languages es fr de] [--workers 8]
+    python translator_cli.py warm-up [--top-history 200] [--processes 4] [--no-speech]
+    python translator_cli.py export translations cache.jsonl.gz
+    python translator_cli.py import history history.jsonl.gz [--profile 3f2a9c1b7d4e]
+    python translator_cli.py compact [--max-age 7776000]
+"""
+import argparse
+import logging
+import os
+import sys
+
+import translator_core as core
+
+
+def add_language_pair(parser):
+    parser.add_argument("--source", default="en", choices=core.SUPPORTED_LANGUAGES, help="Source language")
+    parser.add_argument("--target", required=True, choices=core.SUPPORTED_LANGUAGES, help="Target language")
+    parser.add_argument("--casual", action="store_true", help="Use casual instead of formal language")
+    parser.add_argument("--offline", action="store_true",
+                        help="Only use the phrasebook and stored translations")
+
+
+def run_translate(args):
+    text = args.text if args.text is not None else sys.stdin.read()
+    translation = core.translate_text(text, args.source, args.target, not args.casual, offline=args.offline)
+    print(translation)
+    if args.profile:
+        core.add_to_history(None, text, translation, args.source, args.target, args.profile)
+
+
+def run_batch(args):
+    output_path = args.output
+    if output_path is None:
+        stem, ext = os.path.splitext(args.input)
+        output_path = f"{stem}_{args.target}{ext}"
+
+    def report(lines_done, fraction):
+        print(f"\rTranslated {lines_done} lines ({fraction:.0%})", end="", file=sys.stderr, flush=True)
+
+    with open(args.input, "rb") as source, open(output_path, "w", encoding="utf-8", newline="") as output:
+        core.translate_file(source, args.source, args.target, not args.casual, column=args.column,
+                            on_progress=report, offline=args.offline, output=output)
+    print(f"\nWrote {output_path}", file=sys.stderr)
+
+
+def run_speak(args):
+    data = core.synthesize_speech(args.text, args.lang, core.BASE_SPEECH_RATE)
+    with open(args.output, "wb") as f:
+        f.write(data)
+
+
+def run_history(args):
+    store = core.get_history_store()
+    if store is None:
+        sys.exit("Persistent history is disabled (TRANSLATOR_HISTORY_PATH is empty)")
+    for entry in store.page(args.profile, args.limit, args.offset, args.search):
+        print(f"{entry.display_time}  {entry.source_lang}→{entry.target_lang}  "
+              f"{entry.source_text}  =>  {entry.translated_text}")
+
+
+def run_serve(args):
+    # Imported here so the other commands do not load the HTTP server modules
+    import translator_service
+
+    translator_service.serve(args.host, args.port)
+
+
+def run_prerender_audio(args):
+    def report(done, total):
+        print(f"\rRendered {done}/{total} clips", end="", flush=True)
+
+    counts = core.prerender_phrasebook_audio(args.languages, max_workers=args.workers, on_progress=report)
+    print(f"\nDone: {counts['rendered']} rendered, {counts['skipped']} already cached, "
+          f"{counts['failed']} failed. Clips are in {core.AUDIO_CACHE_DIR}")
+
+
+def run_warm_up(args):
+    def report(stage, done, total):
+        print(f"\rWarming {stage + ':':<13} {done}/{total} tasks", end="", flush=True)
+
+    counts = core.warm_up(args.languages, top_history=args.top_history, processes=args.processes,
+                          threads=args.threads, speech=not args.no_speech, on_progress=report)
+    print(f"\nTranslations: {counts['translated']} added, {counts['cached']} already stored, "
+          f"{counts['failed']} failed")
+    if not args.no_speech:
+        print(f"Speech: {counts['rendered']} rendered, {counts['skipped']} already cached, "
+              f"{counts['speech_failed']} failed")
+
+
+def run_export(args):
+    def report(rows):
+        print(f"\rExported {rows} rows", end="", file=sys.stderr, flush=True)
+
+    try:
+        if args.kind == "translations":
+            count = core.export_translations(args.file, on_progress=report)
+        else:
+            count = core.export_history(args.file, args.profile, on_progress=report)
+    except ValueError as e:
+        sys.exit(str(e))
+    print(f"\nWrote {count} {args.kind} rows to {args.file}", file=sys.stderr)
+
+
+def run_import(args):
+    def report(rows):
+        print(f"\rImported {rows} rows", end="", file=sys.stderr, flush=True)
+
+    try:
+        if args.kind == "translations":
+            count = core.import_translations(args.file, on_progress=report)
+        else:
+            count = core.import_history(args.file, args.profile, on_progress=report)
+    except ValueError as e:
+        sys.exit(f"\nCould not import {args.file}: {e}")
+    print(f"\nLoaded {count} {args.kind} rows from {args.file}", file=sys.stderr)
+
+
+def run_compact(args):
+    store = core.get_translation_store()
+    if store is None:
+        sys.exit("Translation store disabled (TRANSLATOR_STORE_PATH is empty) or unavailable")
+    def size():
+        # The write-ahead log holds recent writes until the checkpoint folds them into the database
+        paths = (store.path, store.path + "-wal")
+        return sum(os.path.getsize(path) for path in paths if os.path.exists(path)) / 1e6
+
+    before = size()
+    removed = store.compact(args.max_age)
+    print(f"Removed {removed} translations; {store.path} went from {before:.1f} MB to {size():.1f} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Translate text and files from the command line")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    translate = commands.add_parser("translate", help="Translate a text (read from stdin when omitted)")
+    translate.add_argument("text", nargs="?")
+    add_language_pair(translate)
+    translate.add_argument("--profile", help="Also record the translation in this history profile")
+    translate.set_defaults(func=run_translate)
+
+    batch = commands.add_parser("batch", help="Translate a TXT file line by line or a CSV column")
+    batch.add_argument("input", help="TXT or CSV file to translate")
+    batch.add_argument("-o", "--output", help="Output file (default: <input>_<target>.<ext>)")
+    batch.add_argument("--column", help="CSV column to translate (default: the first one)")
+    add_language_pair(batch)
+    batch.set_defaults(func=run_batch)
+
+    speak = commands.add_parser("speak", help="Synthesize speech into an MP3 file")
+    speak.add_argument("text")
+    speak.add_argument("--lang", required=True, choices=core.SUPPORTED_LANGUAGES)
+    speak.add_argument("-o", "--output", required=True, help="MP3 file to write")
+    speak.set_defaults(func=run_speak)
+
+    history = commands.add_parser("history", help="List or search a profile's translation history")
+    history.add_argument("--profile", required=True, help="History profile id (the app's ?profile= value)")
+    history.add_argument("--search", help="Only show entries matching these words")
+    history.add_argument("--limit", type=int, default=20)
+    history.add_argument("--offset", type=int, default=0)
+    history.set_defaults(func=run_history)
+
+    serve = commands.add_parser("serve", help="Run the HTTP/JSON translation service")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8080)
+    serve.set_defaults(func=run_serve)
+
+    prerender = commands.add_parser("prerender-audio", help="Pre-render phrasebook audio into the audio cache")
+    prerender.add_argument("--languages", nargs="+", choices=core.SUPPORTED_LANGUAGES,
+                           help="Languages to render (default: all supported languages)")
+    prerender.add_argument("--workers", type=int, default=8, help="Concurrent synthesis requests")
+    prerender.set_defaults(func=run_prerender_audio)
+
+    warm = commands.add_parser(
+        "warm-up", help="Precompute phrasebook and popular history translations and speech (run at deploy time)")
+    warm.add_argument("--languages", nargs="+", choices=core.SUPPORTED_LANGUAGES,
+                      help="Languages to warm up (default: all supported languages)")
+    warm.add_argument("--top-history", type=int, default=core.WARMUP_TOP_HISTORY,
+                      help="Most frequent history texts to include (0 for none)")
+    warm.add_argument("--processes", type=int, default=core.WARMUP_PROCESSES, help="Worker processes")
+    warm.add_argument("--threads", type=int, default=4, help="Concurrent synthesis requests per worker process")
+    warm.add_argument("--no-speech", action="store_true", help="Only warm up translations")
+    warm.set_defaults(func=run_warm_up)
+
+    for name, func, verb in (("export", run_export, "Write"), ("import", run_import, "Load")):
+        transfer = commands.add_parser(
+            name, help=f"{verb} the translation store or history as a gzip-compressed JSON Lines file")
+        transfer.add_argument("kind", choices=["translations", "history"])
+        transfer.add_argument("file", help="Export file (.jsonl.gz)")
+        transfer.add_argument("--profile", help="History only: export this profile, or import every entry into it")
+        transfer.set_defaults(func=func)
+
+    compact = commands.add_parser(
+        "compact", help="Drop old stored translations and reclaim the translation store's free space")
+    compact.add_argument("--max-age", type=float,
+                         help="Drop translations not updated for this many seconds (default: keep all)")
+    compact.set_defaults(func=run_compact)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    try:
+        args.func(args)
+    except core.TranslationBackendError as e:
+        sys.exit(f"Translation failed: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2315 @@
+"""
+Translation, caching, history and text-to-speech core shared by the Streamlit app,
+the HTTP service (translator_service.py) and the command line (translator_cli.py).
+
+Nothing here depends on Streamlit: per-session state such as offline mode and the
+session translation cache is passed in explicitly, and shared resources are
+process-wide singletons built on first use.
+"""
+import contextlib
+import contextvars
+import csv
+import functools
+import gzip
+import hashlib
+import heapq
+import io
+import itertools
+import json
+import logging
+import math
+import multiprocessing
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+import weakref
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime
+from io import BytesIO
+from types import MappingProxyType
+
+import translator_metrics as metrics
+
+logger = logging.getLogger(__name__)
+
+# Shared translation cache settings (can be overridden with environment variables)
+TRANSLATION_CACHE_MAX_ENTRIES = int(os.environ.get("TRANSLATOR_CACHE_MAX_ENTRIES", "10000"))
+TRANSLATION_CACHE_TTL_SECONDS = float(os.environ.get("TRANSLATOR_CACHE_TTL_SECONDS", "86400"))
+
+# Persistent translation store used by offline mode (set to an empty string to disable)
+TRANSLATION_STORE_PATH = os.environ.get(
+    "TRANSLATOR_STORE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "translations.db")
+)
+
+# Translation backend: "simulated" (default) or "http" for a LibreTranslate-compatible API
+TRANSLATION_BACKEND = os.environ.get("TRANSLATOR_BACKEND", "simulated")
+TRANSLATION_API_URL = os.environ.get("TRANSLATOR_API_URL", "")
+TRANSLATION_API_KEY = os.environ.get("TRANSLATOR_API_KEY") or None
+TRANSLATION_HTTP_TIMEOUT = float(os.environ.get("TRANSLATOR_HTTP_TIMEOUT", "10"))
+TRANSLATION_HTTP_RETRIES = int(os.environ.get("TRANSLATOR_HTTP_RETRIES", "2"))
+TRANSLATION_HTTP_MAX_CONCURRENCY = int(os.environ.get("TRANSLATOR_HTTP_MAX_CONCURRENCY", "8"))
+SIMULATED_BACKEND_DELAY = float(os.environ.get("TRANSLATOR_SIMULATED_DELAY", "0.5"))
+
+# Worker threads used to translate the sentences of long inputs concurrently
+TRANSLATION_MAX_WORKERS = int(os.environ.get("TRANSLATOR_MAX_WORKERS", "8"))
+
+# Worker threads used to translate one text into several languages at once, one language per thread
+FANOUT_MAX_WORKERS = int(os.environ.get("TRANSLATOR_FANOUT_MAX_WORKERS", "16"))
+
+# Batch translation: texts per backend request and rows per bulk file chunk
+BATCH_CHUNK_SIZE = int(os.environ.get("TRANSLATOR_BATCH_CHUNK_SIZE", "50"))
+BULK_FILE_CHUNK_ROWS = int(os.environ.get("TRANSLATOR_BULK_CHUNK_ROWS", "500"))
+
+# Per-session translation caches: size limit of each one, memory budget of all of them together,
+# and idle time after which a session's cache is emptied
+SESSION_CACHE_MAX_BYTES = int(float(os.environ.get("TRANSLATOR_SESSION_CACHE_KB", "512")) * 1024)
+SESSION_MEMORY_BUDGET_BYTES = int(float(os.environ.get("TRANSLATOR_SESSION_MEMORY_MB", "256")) * 1024 * 1024)
+SESSION_IDLE_SECONDS = float(os.environ.get("TRANSLATOR_SESSION_IDLE_SECONDS", "1800"))
+
+# Phrasebook data file compiled into the phrase index
+PHRASEBOOK_PATH = os.environ.get(
+    "TRANSLATOR_PHRASEBOOK_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "phrases.json")
+)
+
+# Approximate matching (offline and when the backend is unavailable): minimum similarity and size of the translation memory
+FUZZY_MIN_SCORE = float(os.environ.get("TRANSLATOR_FUZZY_MIN_SCORE", "0.5"))
+FUZZY_MEMORY_MAX_ENTRIES = int(os.environ.get("TRANSLATOR_FUZZY_MEMORY_MAX_ENTRIES", "100000"))
+
+# Approximate matching work per search: posting entries counted and best-ranked candidates scored
+FUZZY_MAX_POSTINGS = int(os.environ.get("TRANSLATOR_FUZZY_MAX_POSTINGS", "2000"))
+FUZZY_MAX_CANDIDATES = int(os.environ.get("TRANSLATOR_FUZZY_MAX_CANDIDATES", "20"))
+
+# Text-to-speech cache: directory of MP3 files plus an in-memory tier bounded in megabytes.
+# The default directory lives under static/ so the Streamlit app can serve clips directly
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+AUDIO_CACHE_DIR = os.environ.get("TRANSLATOR_AUDIO_CACHE_DIR", os.path.join(STATIC_DIR, "audio"))
+AUDIO_CACHE_MEMORY_BYTES = int(float(os.environ.get("TRANSLATOR_AUDIO_CACHE_MEMORY_MB", "64")) * 1024 * 1024)
+
+# Speech is synthesized once at this rate; the speech rate setting is applied at playback
+BASE_SPEECH_RATE = 1.0
+
+# Speech synthesis: "gtts" (default) or "simulated", which returns placeholder bytes after a fixed delay
+TTS_BACKEND = os.environ.get("TRANSLATOR_TTS_BACKEND", "gtts")
+SIMULATED_TTS_DELAY = float(os.environ.get("TRANSLATOR_SIMULATED_TTS_DELAY", "0.3"))
+
+# Backend scheduler: concurrent calls and token-bucket rate limits (requests per second, 0 for none) per backend
+SCHEDULER_TRANSLATION_CONCURRENCY = int(os.environ.get(
+    "TRANSLATOR_BACKEND_MAX_CONCURRENCY", str(TRANSLATION_HTTP_MAX_CONCURRENCY)))
+SCHEDULER_TRANSLATION_RATE = float(os.environ.get("TRANSLATOR_BACKEND_RATE", "0"))
+SCHEDULER_TRANSLATION_BURST = int(os.environ.get("TRANSLATOR_BACKEND_BURST", "20"))
+SCHEDULER_TTS_CONCURRENCY = int(os.environ.get("TRANSLATOR_TTS_MAX_CONCURRENCY", "8"))
+SCHEDULER_TTS_RATE = float(os.environ.get("TRANSLATOR_TTS_RATE", "10"))
+SCHEDULER_TTS_BURST = int(os.environ.get("TRANSLATOR_TTS_BURST", "20"))
+
+# Backend scheduler queue: waiting calls before new ones are refused, and how long interactive calls may wait
+SCHEDULER_MAX_QUEUE = int(os.environ.get("TRANSLATOR_SCHEDULER_MAX_QUEUE", "256"))
+SCHEDULER_QUEUE_TIMEOUT = float(os.environ.get("TRANSLATOR_SCHEDULER_QUEUE_TIMEOUT", "5"))
+
+# Circuit breaker: consecutive backend failures that open it, and seconds before a trial call is let through
+SCHEDULER_FAILURE_THRESHOLD = int(os.environ.get("TRANSLATOR_BREAKER_FAILURES", "5"))
+SCHEDULER_RESET_SECONDS = float(os.environ.get("TRANSLATOR_BREAKER_RESET_SECONDS", "30"))
+
+# Export/import files: rows per chunk held in memory, and gzip level (1 fastest to 9 smallest)
+TRANSFER_CHUNK_ROWS = int(os.environ.get("TRANSLATOR_TRANSFER_CHUNK_ROWS", "5000"))
+TRANSFER_COMPRESSION = int(os.environ.get("TRANSLATOR_TRANSFER_COMPRESSION", "6"))
+
+# Cache warm-up: most frequent history texts included, worker processes, and texts or clips per task
+WARMUP_TOP_HISTORY = int(os.environ.get("TRANSLATOR_WARMUP_TOP_HISTORY", "200"))
+WARMUP_PROCESSES = int(os.environ.get("TRANSLATOR_WARMUP_PROCESSES", str(os.cpu_count() or 2)))
+WARMUP_TASK_SIZE = int(os.environ.get("TRANSLATOR_WARMUP_TASK_SIZE", "200"))
+
+# Languages offered in the language selectors
+SUPPORTED_LANGUAGES = ["en", "es", "fr", "de", "it", "ja", "ko", "zh", "ru", "ar", "hi", "pt"]
+
+# Translation history: items kept in memory per session
+HISTORY_MAX_ITEMS = int(os.environ.get("TRANSLATOR_HISTORY_MAX_ITEMS", "1000"))
+
+# Persistent, searchable history database (set to an empty string to keep history in the session only)
+HISTORY_STORE_PATH = os.environ.get(
+    "TRANSLATOR_HISTORY_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "history.db")
+)
+
+# Performance metrics (see translator_metrics.py)
+TRANSLATE_SECONDS = metrics.histogram(
+    "translator_translate_seconds", "Time to translate one text, cache hits included")
+BATCH_SECONDS = metrics.histogram(
+    "translator_batch_seconds", "Time to translate one batch of texts")
+FANOUT_SECONDS = metrics.histogram(
+    "translator_fanout_seconds", "Time to translate one text into several target languages")
+CACHE_LOOKUP_SECONDS = metrics.histogram(
+    "translator_cache_lookup_seconds", "Time to look a translation up in the cache tiers")
+CACHE_LOOKUPS = metrics.counter(
+    "translator_cache_lookups_total", "Translation cache lookups by the tier that answered (miss if none)", ("tier",))
+BACKEND_SECONDS = metrics.histogram(
+    "translator_backend_request_seconds", "Latency of requests to the translation backend", ("backend",))
+BACKEND_ERRORS = metrics.counter(
+    "translator_backend_errors_total", "Failed translation backend requests", ("backend",))
+COALESCED_CALLS = metrics.counter(
+    "translator_coalesced_calls_total",
+    "Calls that waited for an identical translation or synthesis already in flight instead of repeating it", ("kind",))
+SCHEDULER_WAIT_SECONDS = metrics.histogram(
+    "translator_scheduler_wait_seconds", "Time backend calls waited for the scheduler to admit them",
+    ("backend", "priority"))
+SCHEDULER_REJECTIONS = metrics.counter(
+    "translator_scheduler_rejections_total",
+    "Backend calls refused by the scheduler: circuit open, queue full or queue timeout", ("backend", "reason"))
+BACKEND_FALLBACKS = metrics.counter(
+    "translator_backend_fallbacks_total", "Translations answered locally because the backend was unavailable")
+TTS_SECONDS = metrics.histogram(
+    "translator_tts_synthesis_seconds", "Time to synthesize one speech clip on an audio cache miss", ("backend",))
+metrics.gauge("translator_translation_cache_entries", "Entries in the shared translation cache",
+              callback=lambda: get_translation_cache().stats()["entries"])
+metrics.gauge("translator_translation_cache_hit_ratio", "Hit ratio of the shared translation cache",
+              callback=lambda: get_translation_cache().stats()["hit_rate"])
+metrics.gauge("translator_session_caches", "Live per-session translation caches",
+              callback=lambda: get_session_registry().stats()["sessions"])
+metrics.gauge("translator_session_cache_bytes", "Approximate bytes held by all per-session translation caches",
+              callback=lambda: get_session_registry().stats()["bytes"])
+metrics.gauge("translator_scheduler_queued", "Backend calls waiting in the scheduler queue", ("backend",),
+              callback=lambda: {(scheduler.name,): scheduler.stats()["queued"] for scheduler in get_schedulers()})
+metrics.gauge("translator_circuit_open", "1 while a backend's circuit breaker refuses calls", ("backend",),
+              callback=lambda: {(scheduler.name,): int(scheduler.stats()["state"] != "closed")
+                                for scheduler in get_schedulers()})
+metrics.gauge("translator_audio_cache_memory_bytes", "Bytes of speech held in the audio cache memory tier",
+              callback=lambda: get_audio_cache().stats()["memory_bytes"])
+metrics.gauge("translator_audio_cache_hit_ratio", "Hit ratio of the audio cache (memory and disk)",
+              callback=lambda: get_audio_cache().stats()["hit_rate"])
+
+# Process-wide resources are built on first use and shared by every session, request and thread
+def singleton(factory):
+    """Decorate a zero-argument factory so it runs at most once per process; .clear() drops the instance"""
+    lock = threading.Lock()
+    instance = []
+    
+    @functools.wraps(factory)
+    def get():
+        if not instance:
+            with lock:
+                if not instance:
+                    instance.append(factory())
+        return instance[0]
+    
+    get.clear = instance.clear
+    return get
+
+# Coalesce concurrent identical calls, so a burst of sessions asking for the same thing makes one backend call
+class SingleFlight:
+    """
+    Runs at most one call per key at a time. Callers arriving while a call for their key
+    is in flight wait for it and get its result, or its exception, instead of repeating it.
+    """
+
+    def __init__(self, kind):
+        self.kind = kind
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args):
+        """Return fn(*args), sharing the call with concurrent callers of the same key"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            COALESCED_CALLS.inc(kind=self.kind)
+            return future.result()
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            self._finish(key)
+            future.set_exception(e)
+            raise
+        self._finish(key)
+        future.set_result(result)
+        return result
+
+    def _finish(self, key):
+        # Later callers start a new call (normally a cache hit by now) instead of joining a finished one
+        with self._lock:
+            del self._calls[key]
+
+    def in_flight(self):
+        """Return the number of calls currently running"""
+        with self._lock:
+            return len(self._calls)
+
+@singleton
+def get_translation_flights():
+    """Return the coalescer for backend translations, keyed by text, languages and formality"""
+    return SingleFlight("translation")
+
+@singleton
+def get_speech_flights():
+    """Return the coalescer for speech synthesis, keyed by text, language and rate"""
+    return SingleFlight("speech")
+
+# Priority classes of backend calls, most urgent first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_AUTO = 1
+PRIORITY_BATCH = 2
+PRIORITY_NAMES = ("interactive", "auto", "batch")
+
+# Priority of the backend calls made in the current context; worker tasks inherit it through submit_in_context
+_backend_priority = contextvars.ContextVar("backend_priority", default=PRIORITY_INTERACTIVE)
+
+@contextlib.contextmanager
+def backend_priority(priority):
+    """Make the backend calls of the enclosed code (and of tasks it submits) run at priority"""
+    token = _backend_priority.set(priority)
+    try:
+        yield
+    finally:
+        _backend_priority.reset(token)
+
+def submit_in_context(executor, fn, *args):
+    """Submit fn(*args) to executor, running it at the caller's backend priority"""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+# Rate limiting, priority queueing and circuit breaking in front of a backend
+class BackendScheduler:
+    """
+    Admits calls to a backend in priority order: at most max_concurrency run at once, and a
+    token bucket holds them to rate per second with bursts of up to burst (rate 0 disables it).
+    Waiting calls queue behind more urgent ones; batch calls wait as long as it takes, which
+    slows bulk work down, while other calls give up after queue_timeout seconds, and calls
+    beyond max_queue are refused at once. After failure_threshold consecutive failures the
+    circuit opens and every call is refused for reset_seconds, then one trial call decides
+    whether it closes again. Refused calls raise BackendUnavailableError.
+    """
+
+    def __init__(self, name, max_concurrency, rate=0, burst=1, max_queue=256, queue_timeout=5.0,
+                 failure_threshold=5, reset_seconds=30.0):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.rejected = defaultdict(int)
+        self._cond = threading.Condition()
+        self._queue = []
+        self._tickets = itertools.count()
+        self._active = 0
+        self._tokens = float(self.burst)
+        self._refilled = time.monotonic()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def call(self, fn, *args):
+        """Return fn(*args) once admitted at the current backend priority"""
+        priority = _backend_priority.get()
+        start = time.perf_counter()
+        probe = self._acquire(priority)
+        SCHEDULER_WAIT_SECONDS.observe(time.perf_counter() - start, backend=self.name,
+                                       priority=PRIORITY_NAMES[priority])
+        try:
+            result = fn(*args)
+        except Exception:
+            self._release(probe, succeeded=False)
+            raise
+        self._release(probe, succeeded=True)
+        return result
+
+    def _acquire(self, priority):
+        with self._cond:
+            probe = self._check_circuit()
+            if len(self._queue) >= self.max_queue:
+                if probe:
+                    self._probing = False
+                self._reject("queue_full", f"{len(self._queue)} calls already waiting")
+            ticket = (priority, next(self._tickets))
+            heapq.heappush(self._queue, ticket)
+            deadline = None if priority == PRIORITY_BATCH else time.monotonic() + self.queue_timeout
+            try:
+                while True:
+                    # Calls queued before the circuit opened are refused instead of piling onto a failing backend
+                    if self._opened_at is not None and not probe:
+                        self._reject("circuit_open", "circuit open after repeated failures")
+                    wait = None
+                    if self._queue[0] == ticket and self._active < self.max_concurrency:
+                        wait = self._take_token()
+                        if wait == 0:
+                            heapq.heappop(self._queue)
+                            self._active += 1
+                            if self._queue and self._active < self.max_concurrency:
+                                # The next call in line may fit in a slot that is still free
+                                self._cond.notify_all()
+                            return probe
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._reject("timeout", f"no slot free within {self.queue_timeout:g} s")
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._cond.wait(wait)
+            except BaseException:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                if probe:
+                    self._probing = False
+                self._cond.notify_all()
+                raise
+
+    def _check_circuit(self):
+        """Return True if this call is the trial call of a half-open circuit; refuse calls while it is open"""
+        if self._opened_at is None:
+            return False
+        if self._probing or time.monotonic() - self._opened_at < self.reset_seconds:
+            self._reject("circuit_open", "circuit open after repeated failures")
+        self._probing = True
+        return True
+
+    def _take_token(self):
+        """Take a token from the bucket and return 0, or return the seconds until one is available"""
+        if self.rate <= 0:
+            return 0
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self.rate
+
+    def _reject(self, reason, message):
+        self.rejected[reason] += 1
+        SCHEDULER_REJECTIONS.inc(backend=self.name, reason=reason)
+        raise BackendUnavailableError(f"The {self.name} backend is unavailable: {message}")
+
+    def _release(self, probe, succeeded):
+        with self._cond:
+            self._active -= 1
+            if probe:
+                self._probing = False
+            if succeeded:
+                self._failures = 0
+                self._opened_at = None
+            else:
+                self._failures += 1
+                if probe or self._failures >= self.failure_threshold:
+                    if self._opened_at is None:
+                        logger.warning("Opening the %s circuit after %d consecutive failures",
+                                       self.name, self._failures)
+                    self._opened_at = time.monotonic()
+            if self._queue:
+                self._cond.notify_all()
+
+    def share_limits(self, parts):
+        """Keep this scheduler to 1/parts of its rate and burst, for one of parts processes sharing the backend"""
+        with self._cond:
+            self.rate /= parts
+            self.burst = max(self.burst // parts, 1)
+            self._tokens = min(self._tokens, self.burst)
+
+    def stats(self):
+        """Return the circuit state (closed, open or half-open), running and queued calls, and refusals by reason"""
+        with self._cond:
+            if self._opened_at is None:
+                state = "closed"
+            elif self._probing or time.monotonic() - self._opened_at >= self.reset_seconds:
+                state = "half-open"
+            else:
+                state = "open"
+            return {
+                "state": state,
+                "active": self._active,
+                "queued": len(self._queue),
+                "failures": self._failures,
+                "rejected": dict(self.rejected),
+            }
+
+@singleton
+def get_translation_scheduler():
+    """Return the scheduler in front of the remote translation backend"""
+    return BackendScheduler(
+        "translation", SCHEDULER_TRANSLATION_CONCURRENCY, SCHEDULER_TRANSLATION_RATE, SCHEDULER_TRANSLATION_BURST,
+        SCHEDULER_MAX_QUEUE, SCHEDULER_QUEUE_TIMEOUT, SCHEDULER_FAILURE_THRESHOLD, SCHEDULER_RESET_SECONDS
+    )
+
+@singleton
+def get_speech_scheduler():
+    """Return the scheduler in front of the speech synthesizer"""
+    return BackendScheduler(
+        "speech", SCHEDULER_TTS_CONCURRENCY, SCHEDULER_TTS_RATE, SCHEDULER_TTS_BURST,
+        SCHEDULER_MAX_QUEUE, SCHEDULER_QUEUE_TIMEOUT, SCHEDULER_FAILURE_THRESHOLD, SCHEDULER_RESET_SECONDS
+    )
+
+def get_schedulers():
+    """Return every backend scheduler"""
+    return [get_translation_scheduler(), get_speech_scheduler()]
+
+# Process-wide translation cache shared by all sessions
+class TranslationCache:
+    """Thread-safe LRU cache with a per-entry time-to-live and hit/miss counters"""
+
+    def __init__(self, max_entries=TRANSLATION_CACHE_MAX_ENTRIES, ttl_seconds=TRANSLATION_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value for key, or None if it is missing or expired"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= now:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, ttl_seconds=None):
+        """Store a value, evicting the least recently used entries when full"""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        expires_at = time.monotonic() + ttl if ttl and ttl > 0 else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Remove every entry and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Return a snapshot of the cache counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+@singleton
+def get_translation_cache():
+    """Return the translation cache shared by every session in this process"""
+    return TranslationCache()
+
+# SQLite database file opened once per thread, shared by the persistent stores
+class SQLiteStore:
+    """Base class giving each thread its own WAL-mode connection to the database at path"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self):
+        # One connection per thread; WAL lets readers in other processes run alongside a writer
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _stream(self, sql, params=()):
+        """Yield the rows of a query from a separate connection, so a long read does not interleave with writes"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            yield from conn.execute(sql, params)
+        finally:
+            conn.close()
+
+# Durable on-disk translation store shared by every worker process
+class TranslationStore(SQLiteStore):
+    """SQLite (WAL) key-value store of translations keyed by text, languages and formality"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS translations (
+                    text TEXT NOT NULL,
+                    source_lang TEXT NOT NULL,
+                    target_lang TEXT NOT NULL,
+                    formality INTEGER NOT NULL,
+                    translation TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (text, source_lang, target_lang, formality)
+                ) WITHOUT ROWID
+            """)
+
+    def get(self, text, source_lang, target_lang, formality):
+        """Look up a single translation through the primary key index"""
+        row = self._connect().execute(
+            "SELECT translation FROM translations "
+            "WHERE text = ? AND source_lang = ? AND target_lang = ? AND formality = ?",
+            (text, source_lang, target_lang, int(bool(formality)))
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_many(self, texts, source_lang, target_lang, formality, chunk_size=500):
+        """Look up many texts for one language pair, returning a dict of the ones found"""
+        texts = list(texts)
+        found = {}
+        conn = self._connect()
+        for start in range(0, len(texts), chunk_size):
+            chunk = texts[start:start + chunk_size]
+            placeholders = ", ".join("?" * len(chunk))
+            found.update(conn.execute(
+                "SELECT text, translation FROM translations "
+                f"WHERE source_lang = ? AND target_lang = ? AND formality = ? AND text IN ({placeholders})",
+                (source_lang, target_lang, int(bool(formality)), *chunk)
+            ).fetchall())
+        return found
+
+    def put(self, text, source_lang, target_lang, formality, translation):
+        """Insert or replace a single translation"""
+        self.put_rows([(text, source_lang, target_lang, formality, translation, time.time())])
+
+    def put_rows(self, rows):
+        """Insert or replace (text, source_lang, target_lang, formality, translation, updated_at) rows in one transaction"""
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?)",
+                ((text, src, tgt, int(bool(formal)), translation, updated_at)
+                 for text, src, tgt, formal, translation, updated_at in rows)
+            )
+
+    def iter_rows(self):
+        """Yield every (text, source_lang, target_lang, formality, translation, updated_at) row, streaming from disk"""
+        return self._stream(
+            "SELECT text, source_lang, target_lang, formality, translation, updated_at FROM translations"
+        )
+
+    def count(self):
+        """Return the number of stored translations"""
+        return self._connect().execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+
+    def compact(self, max_age_seconds=None):
+        """Drop entries older than max_age_seconds, then checkpoint the WAL and reclaim free pages"""
+        conn = self._connect()
+        removed = 0
+        if max_age_seconds is not None:
+            with conn:
+                removed = conn.execute(
+                    "DELETE FROM translations WHERE updated_at < ?",
+                    (time.time() - max_age_seconds,)
+                ).rowcount
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("VACUUM")
+        return removed
+
+    def clear(self):
+        """Delete every stored translation"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM translations")
+
+@singleton
+def get_translation_store():
+    """Return the persistent translation store, or None if it is disabled or unavailable"""
+    if not TRANSLATION_STORE_PATH:
+        return None
+    try:
+        return TranslationStore(TRANSLATION_STORE_PATH)
+    except sqlite3.Error as e:
+        logger.warning("Persistent translation store unavailable: %s", e)
+        return None
+
+# Per-session translation cache bounded in bytes rather than entries
+class SessionCache:
+    """
+    Thread-safe LRU mapping of (text, source, target, formality) to translations whose
+    approximate size is kept under max_bytes. Evicted entries move to the shared tiers,
+    and every instance counts against the process-wide session memory budget. The
+    session's other large results (the last fan-out, bulk file and so on) are held here
+    too, so they count against the budget and are released with the translations.
+    """
+
+    # Rough per-entry cost of the OrderedDict slot and the key and value tuples
+    ENTRY_OVERHEAD = 200
+
+    def __init__(self, max_bytes=SESSION_CACHE_MAX_BYTES, registry=None):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.evictions = 0
+        self.last_used = time.monotonic()
+        self._entries = OrderedDict()
+        self._held = {}
+        self._lock = threading.Lock()
+        # Results still held when the session ends are released with it
+        weakref.finalize(self, self._release, self._held)
+        self._registry = registry or get_session_registry()
+        self._registry.register(self)
+
+    def entry_size(self, key, value):
+        return sum(sys.getsizeof(part) for part in key) + sys.getsizeof(value) + self.ENTRY_OVERHEAD
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.put(key, value)
+
+    def get(self, key, default=None):
+        """Return the cached translation for key, marking it (and the session) as recently used"""
+        self.last_used = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value):
+        """Store a translation, evicting least recently used entries beyond max_bytes"""
+        size = self.entry_size(key, value)
+        self.last_used = time.monotonic()
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            self.nbytes += size - (previous[1] if previous else 0)
+            self._entries[key] = (value, size)
+            evicted = self._evict(self.max_bytes)
+        self._spill(evicted)
+        self._registry.enforce()
+
+    def value_size(self, value):
+        """Rough size of a held result: strings, bytes and containers of them"""
+        if isinstance(value, dict):
+            return sys.getsizeof(value) + sum(self.value_size(k) + self.value_size(v) for k, v in value.items())
+        if isinstance(value, (list, tuple, set, frozenset)):
+            return sys.getsizeof(value) + sum(self.value_size(item) for item in value)
+        return sys.getsizeof(value)
+
+    def hold(self, name, value, on_release=None):
+        """
+        Keep a per-session result under name, replacing the previous one. It counts against
+        the session's size until the session is released, when it is dropped and
+        on_release() is called (e.g. to delete a file the result points to).
+        """
+        size = self.value_size(value)
+        self.last_used = time.monotonic()
+        with self._lock:
+            previous = self._held.pop(name, None)
+            self.nbytes += size - (previous[1] if previous else 0)
+            self._held[name] = (value, size, on_release)
+            evicted = self._evict(self.max_bytes)
+        if previous is not None:
+            self._release({name: previous})
+        self._spill(evicted)
+        self._registry.enforce()
+
+    def held(self, name, default=None):
+        """Return the result held under name, or default if there is none or it was released"""
+        self.last_used = time.monotonic()
+        entry = self._held.get(name)
+        return entry[0] if entry is not None else default
+
+    def shrink(self, max_bytes=0):
+        """
+        Evict least recently used entries until at most max_bytes remain; shrinking to 0
+        also releases the held results. Returns the bytes freed.
+        """
+        with self._lock:
+            before = self.nbytes
+            evicted = self._evict(max_bytes)
+            released = {}
+            if max_bytes == 0:
+                # Emptied in place: the finalizer refers to this dict
+                released = dict(self._held)
+                self._held.clear()
+                self.nbytes -= sum(size for _, size, _ in released.values())
+            freed = before - self.nbytes
+        self._spill(evicted)
+        self._release(released)
+        return freed
+
+    def clear(self):
+        """Drop every entry without moving it to the shared tiers; held results are kept"""
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = sum(size for _, size, _ in self._held.values())
+
+    def _evict(self, max_bytes):
+        # Called with the lock held
+        evicted = []
+        while self._entries and self.nbytes > max_bytes:
+            key, (value, size) = self._entries.popitem(last=False)
+            self.nbytes -= size
+            evicted.append((key, value))
+        self.evictions += len(evicted)
+        return evicted
+
+    @staticmethod
+    def _release(held):
+        # Called without the lock; held maps names to (value, size, on_release)
+        for _, _, on_release in held.values():
+            if on_release is not None:
+                on_release()
+
+    def _spill(self, evicted):
+        # Backend results are written through to the store when they are translated, so evicted
+        # entries only need a new home in the shared cache when there is no store
+        if not evicted or get_translation_store() is not None:
+            return
+        shared_cache = get_translation_cache()
+        for key, value in evicted:
+            shared_cache.put(key, value)
+
+# Memory accounting for every session cache of the process
+class SessionRegistry:
+    """
+    Tracks the live SessionCaches (sessions that end are dropped with their cache) and
+    keeps them within the global budget: idle sessions are emptied first, then the least
+    recently used ones until the total fits. Enforced whenever a session is created or
+    a session cache grows, so no background thread is needed.
+    """
+
+    def __init__(self, budget_bytes=SESSION_MEMORY_BUDGET_BYTES, idle_seconds=SESSION_IDLE_SECONDS):
+        self.budget_bytes = budget_bytes
+        self.idle_seconds = idle_seconds
+        self.idle_releases = 0
+        self.budget_releases = 0
+        self._sessions = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def register(self, cache):
+        with self._lock:
+            self._sessions.add(cache)
+        self.enforce()
+
+    def sessions(self):
+        with self._lock:
+            return list(self._sessions)
+
+    def enforce(self):
+        """Empty idle session caches, then the least recently used ones while over the budget"""
+        now = time.monotonic()
+        sessions = sorted(self.sessions(), key=lambda cache: cache.last_used)
+        total = sum(cache.nbytes for cache in sessions)
+        for cache in sessions:
+            idle = now - cache.last_used > self.idle_seconds
+            if not idle and total <= self.budget_bytes:
+                break
+            if cache.nbytes:
+                total -= cache.shrink(0)
+                with self._lock:
+                    if idle:
+                        self.idle_releases += 1
+                    else:
+                        self.budget_releases += 1
+
+    def stats(self):
+        """Return a snapshot of the session memory counters"""
+        sessions = self.sessions()
+        return {
+            "sessions": len(sessions),
+            "bytes": sum(cache.nbytes for cache in sessions),
+            "budget_bytes": self.budget_bytes,
+            "idle_releases": self.idle_releases,
+            "budget_releases": self.budget_releases,
+        }
+
+@singleton
+def get_session_registry():
+    """Return the registry accounting the session caches of this process"""
+    return SessionRegistry()
+
+# Normalize a phrase for lookup: case, whitespace and punctuation are ignored
+def normalize_phrase(text):
+    """Return the lookup key for text (casefolded, punctuation removed, whitespace collapsed)"""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = "".join(" " if unicodedata.category(ch).startswith("P") else ch for ch in text)
+    return " ".join(text.split())
+
+# Lookups ignore punctuation, so a phrasebook answer gets the input's sentence-final punctuation back
+def keep_final_punctuation(text, translation):
+    """Return translation ending with the trailing punctuation of text, unless it ends with punctuation already"""
+    stripped = text.rstrip()
+    end = len(stripped)
+    while end and unicodedata.category(stripped[end - 1]).startswith("P"):
+        end -= 1
+    if end == len(stripped) or (translation and unicodedata.category(translation[-1]).startswith("P")):
+        return translation
+    return translation + stripped[end:]
+
+# Character trigrams of a normalized phrase, padded so short words still produce grams
+def phrase_trigrams(text):
+    """Return the set of character trigrams of the normalized text"""
+    return normalized_trigrams(normalize_phrase(text))
+
+def normalized_trigrams(normalized):
+    """Return the set of character trigrams of text already passed through normalize_phrase"""
+    padded = f"  {normalized} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+# Approximate string lookup over word and trigram inverted indexes
+class FuzzyIndex:
+    """
+    Trigram index returning the most similar known key (Jaccard similarity).
+    A search counts, for each key, how many of the query's words and trigrams it
+    shares, walking the smallest postings first (rare words, then rare trigrams) until
+    max_postings entries have been counted; only the max_candidates keys sharing the
+    most are scored, outside the lock. The work per search is bounded however large
+    the index or common the words, at the cost of missing matches that share none of
+    the query's rarer words and trigrams.
+    """
+
+    def __init__(self, max_entries=None, max_postings=None, max_candidates=None):
+        self.max_entries = max_entries
+        self.max_postings = max_postings or FUZZY_MAX_POSTINGS
+        self.max_candidates = max_candidates or FUZZY_MAX_CANDIDATES
+        self._entries = OrderedDict()
+        self._postings = defaultdict(set)
+        self._word_postings = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, key, payload):
+        """Index key with an associated payload, dropping the oldest entry when full"""
+        normalized = normalize_phrase(key)
+        grams = normalized_trigrams(normalized)
+        if not grams:
+            return
+        words = frozenset(normalized.split())
+        with self._lock:
+            if key in self._entries:
+                self._unindex(key)
+            self._entries[key] = (grams, words, payload)
+            for gram in grams:
+                self._postings[gram].add(key)
+            for word in words:
+                self._word_postings[word].add(key)
+            if self.max_entries is not None and len(self._entries) > self.max_entries:
+                self._unindex(next(iter(self._entries)))
+
+    def discard(self, key):
+        """Remove key from the index if present"""
+        with self._lock:
+            if key in self._entries:
+                self._unindex(key)
+
+    def _unindex(self, key):
+        grams, words, _ = self._entries.pop(key)
+        for postings, tokens in ((self._postings, grams), (self._word_postings, words)):
+            for token in tokens:
+                keys = postings[token]
+                keys.discard(key)
+                if not keys:
+                    del postings[token]
+
+    def search(self, text, min_score=0.5):
+        """Return (payload, score, key) for the closest entry scoring at least min_score, or None"""
+        normalized = normalize_phrase(text)
+        query = normalized_trigrams(normalized)
+        if not query:
+            return None
+        with self._lock:
+            word_postings = sorted((self._word_postings[word] for word in set(normalized.split())
+                                    if word in self._word_postings), key=len)
+            gram_postings = sorted((self._postings[gram] for gram in query if gram in self._postings), key=len)
+            
+            # Keys sharing two of the query's three rarest words include every near duplicate of a sentence;
+            # set intersections cost a fraction of counting per key, so larger postings are allowed here
+            shortlist = set()
+            if len(word_postings) >= 2 and len(word_postings[1]) <= 4 * self.max_postings:
+                first, second, *rest = word_postings[:3]
+                shortlist = first & second
+                for keys in rest:
+                    shortlist |= (first & keys) | (second & keys)
+                if len(shortlist) > self.max_postings // 4:
+                    shortlist = set()
+            
+            # Keys sharing the rarest trigrams, counted up to half the budget, also catch misspelled words
+            counts = Counter()
+            budget = self.max_postings // 2
+            remaining = list(word_postings)
+            for keys in gram_postings:
+                if len(keys) <= budget:
+                    budget -= len(keys)
+                    counts.update(keys)
+                else:
+                    remaining.append(keys)
+            shortlist.update(key for key, _ in counts.most_common(self.max_candidates * 4))
+            
+            # The other half ranks the shortlist by the words and trigrams not counted yet, one lookup per key
+            budget = self.max_postings // 2
+            for keys in remaining:
+                if len(shortlist) > budget:
+                    break
+                budget -= len(shortlist)
+                counts.update(keys.intersection(shortlist))
+            candidates = [(key, self._entries[key])
+                          for key in heapq.nlargest(self.max_candidates, shortlist, key=counts.__getitem__)]
+        
+        # Entries are immutable tuples, so they are scored without holding the lock
+        best = None
+        min_len, max_len = min_score * len(query), len(query) / min_score if min_score > 0 else math.inf
+        for key, (grams_b, _, payload) in candidates:
+            if not min_len <= len(grams_b) <= max_len:
+                continue
+            overlap = len(query & grams_b)
+            score = overlap / (len(query) + len(grams_b) - overlap)
+            if score >= min_score and (best is None or score > best[1]):
+                best = (payload, score, key)
+        return best
+
+# Immutable phrase index compiled once from the phrasebook data file
+class PhraseIndex:
+    """
+    Maps (language, normalized phrase) to a phrase id. Every phrase id holds the
+    English source and its translations, so any pair pivots through English.
+    """
+
+    def __init__(self, translations, categories, pivot_lang="en"):
+        phrases = []
+        index = {}
+        for pivot_text, targets in translations.items():
+            entry = dict(targets)
+            entry[pivot_lang] = pivot_text
+            phrase_id = len(phrases)
+            phrases.append(MappingProxyType(entry))
+            for lang, text in entry.items():
+                index.setdefault((lang, normalize_phrase(text)), phrase_id)
+        self.pivot_lang = pivot_lang
+        self._phrases = tuple(phrases)
+        self._index = MappingProxyType(index)
+        self._fuzzy = {}
+        for phrase_id, entry in enumerate(self._phrases):
+            for lang, text in entry.items():
+                self._fuzzy.setdefault(lang, FuzzyIndex()).add(text, phrase_id)
+        self.categories = MappingProxyType({name: tuple(items) for name, items in categories.items()})
+
+    @classmethod
+    def from_file(cls, path):
+        """Compile the index from a phrasebook JSON file"""
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["translations"], data.get("categories", {}), data.get("source_language", "en"))
+
+    def __len__(self):
+        return len(self._phrases)
+
+    def find(self, text, lang):
+        """Return the phrase id for text written in lang, or None"""
+        return self._index.get((lang, normalize_phrase(text)))
+
+    def phrase(self, phrase_id, lang):
+        """Return the phrase with the given id in lang, or None"""
+        return self._phrases[phrase_id].get(lang)
+
+    def lookup(self, text, source_lang, target_lang):
+        """Translate a known phrase with a single hash lookup, or return None"""
+        phrase_id = self.find(text, source_lang)
+        if phrase_id is None:
+            return None
+        translation = self._phrases[phrase_id].get(target_lang)
+        return keep_final_punctuation(text, translation) if translation is not None else None
+
+    def fuzzy_lookup(self, text, source_lang, target_lang, min_score=None):
+        """Return (translation, score) for the closest known phrase, or None"""
+        fuzzy = self._fuzzy.get(source_lang)
+        match = fuzzy.search(text, FUZZY_MIN_SCORE if min_score is None else min_score) if fuzzy else None
+        if match is None:
+            return None
+        translation = self._phrases[match[0]].get(target_lang)
+        return (translation, match[1]) if translation is not None else None
+
+@singleton
+def get_phrase_index():
+    """Load and compile the phrasebook once per process"""
+    return PhraseIndex.from_file(PHRASEBOOK_PATH)
+
+# Fuzzy index over translations produced in this process, one per language pair and formality
+@singleton
+def get_translation_memory():
+    """Return the process-wide dict of FuzzyIndex objects keyed by (source, target, formality)"""
+    return {}
+
+def remember_translation(text, source_lang, target_lang, formality, translation):
+    """Make a translation available to approximate lookups"""
+    memory = get_translation_memory()
+    key = (source_lang, target_lang, bool(formality))
+    index = memory.get(key)
+    if index is None:
+        index = memory.setdefault(key, FuzzyIndex(max_entries=FUZZY_MEMORY_MAX_ENTRIES))
+    index.add(text, translation)
+
+def find_approximate_translation(text, source_lang, target_lang, formality, min_score=None):
+    """Return (translation, confidence) from the closest phrasebook or cached text, or None"""
+    min_score = FUZZY_MIN_SCORE if min_score is None else min_score
+    best = get_phrase_index().fuzzy_lookup(text, source_lang, target_lang, min_score)
+    index = get_translation_memory().get((source_lang, target_lang, bool(formality)))
+    match = index.search(text, min_score) if index is not None else None
+    if match is not None and (best is None or match[1] > best[1]):
+        best = (match[0], match[1])
+    return best
+
+def format_approximate_translation(translation, score):
+    """Tag an approximate match with its confidence"""
+    return f"[≈{score:.0%} match] {translation}"
+
+# Raised when a translation backend cannot produce a result
+class TranslationBackendError(Exception):
+    pass
+
+class BackendUnavailableError(TranslationBackendError):
+    """Raised when the backend scheduler refuses a call: the circuit is open or the queue is full"""
+
+# Translation backends (simulated, phrase dictionary and HTTP API)
+class TranslationBackend:
+    """Base class for translation backends"""
+
+    name = "base"
+
+    def translate(self, text, source_lang, target_lang, formality):
+        """Translate a single text"""
+        return self.translate_many([text], source_lang, target_lang, formality)[0]
+
+    def translate_many(self, texts, source_lang, target_lang, formality):
+        """Translate a list of texts, returning results in the same order"""
+        return [self.translate(text, source_lang, target_lang, formality) for text in texts]
+
+    def close(self):
+        """Release pooled resources held by the backend"""
+
+class SimulatedBackend(TranslationBackend):
+    """Stand-in for a real API: waits for a fixed delay and tags the text with its language pair"""
+
+    name = "simulated"
+
+    def __init__(self, delay=0.5):
+        self.delay = delay
+
+    def translate_many(self, texts, source_lang, target_lang, formality):
+        # One simulated round trip per request, however many texts it carries
+        with BACKEND_SECONDS.time(backend=self.name):
+            time.sleep(self.delay)
+        if source_lang == target_lang:
+            # If source and target are the same, return the original text
+            return list(texts)
+        # For other cases, append a prefix to show it's a simulated translation
+        formality_str = "[FORMAL] " if formality else "[CASUAL] "
+        return [f"{formality_str}[Translated from {source_lang} to {target_lang}]: {text}" for text in texts]
+
+class ScheduledBackend(TranslationBackend):
+    """Sends every request of another backend through a BackendScheduler"""
+
+    name = "scheduled"
+
+    def __init__(self, backend, scheduler):
+        self.backend = backend
+        self.scheduler = scheduler
+
+    def translate_many(self, texts, source_lang, target_lang, formality):
+        return self.scheduler.call(self.backend.translate_many, texts, source_lang, target_lang, formality)
+
+    def close(self):
+        super().close()
+        self.backend.close()
+
+class DictionaryBackend(TranslationBackend):
+    """Answers known phrases locally and forwards everything else to a fallback backend"""
+
+    name = "dictionary"
+
+    def __init__(self, phrase_index, fallback=None):
+        self.phrase_index = phrase_index
+        self.fallback = fallback
+
+    def translate_many(self, texts, source_lang, target_lang, formality):
+        if source_lang == target_lang:
+            return list(texts)
+        # Only exact phrasebook hits: approximate matches would be stored as if the backend had produced them
+        results = [self.phrase_index.lookup(text, source_lang, target_lang) for text in texts]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing and self.fallback is None:
+            raise TranslationBackendError(f"No phrasebook entry for {len(missing)} text(s)")
+        if missing:
+            translated = self.fallback.translate_many(
+                [texts[i] for i in missing], source_lang, target_lang, formality
+            )
+            for i, result in zip(missing, translated):
+                results[i] = result
+        return results
+
+    def close(self):
+        super().close()
+        if self.fallback is not None:
+            self.fallback.close()
+
+class HTTPBackend(TranslationBackend):
+    """LibreTranslate-style JSON API client using a pooled keep-alive session with retries"""
+
+    name = "http"
+
+    def __init__(self, url, api_key=None, timeout=10.0, retries=2, max_concurrency=8):
+        # requests is only imported when the http backend is configured
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.url = url
+        self.api_key = api_key
+        self.timeout = (min(timeout, 3.05), timeout)
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.3,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=None,
+        )
+        # The pool holds one keep-alive connection per concurrent request; the scheduler caps how many run
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def translate_many(self, texts, source_lang, target_lang, formality):
+        import requests
+        
+        payload = {
+            "q": list(texts),
+            "source": source_lang,
+            "target": target_lang,
+            "format": "text",
+            "formality": "formal" if formality else "informal",
+        }
+        if self.api_key:
+            payload["api_key"] = self.api_key
+        with BACKEND_SECONDS.time(backend=self.name):
+            try:
+                response = self.session.post(self.url, json=payload, timeout=self.timeout)
+                response.raise_for_status()
+                translated = response.json()["translatedText"]
+            except (requests.RequestException, ValueError, KeyError) as e:
+                BACKEND_ERRORS.inc(backend=self.name)
+                raise TranslationBackendError(f"Translation API request failed: {e}") from e
+        if isinstance(translated, str):
+            translated = [translated]
+        if len(translated) != len(texts):
+            raise TranslationBackendError(
+                f"Translation API returned {len(translated)} results for {len(texts)} texts"
+            )
+        return translated
+
+    def close(self):
+        super().close()
+        self.session.close()
+
+@singleton
+def get_translation_backend():
+    """Build the configured backend once per process; phrasebook hits never leave the machine"""
+    if TRANSLATION_BACKEND == "http":
+        if not TRANSLATION_API_URL:
+            raise TranslationBackendError("TRANSLATOR_API_URL must be set to use the http backend")
+        fallback = HTTPBackend(
+            TRANSLATION_API_URL,
+            api_key=TRANSLATION_API_KEY,
+            timeout=TRANSLATION_HTTP_TIMEOUT,
+            retries=TRANSLATION_HTTP_RETRIES,
+            max_concurrency=TRANSLATION_HTTP_MAX_CONCURRENCY,
+        )
+    else:
+        fallback = SimulatedBackend(delay=SIMULATED_BACKEND_DELAY)
+    # Only requests that leave the machine are rate limited, prioritized and circuit broken
+    return DictionaryBackend(get_phrase_index(), fallback=ScheduledBackend(fallback, get_translation_scheduler()))
+
+# Content-addressed cache of synthesized speech
+class AudioCache:
+    """MP3 cache keyed by (text, lang, speech_rate): an in-memory LRU bounded in bytes in front of a directory on disk"""
+
+    def __init__(self, directory, max_memory_bytes):
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self.memory_bytes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def digest(text, lang, speech_rate):
+        """Return the content address of a clip"""
+        return hashlib.sha256(f"{lang}\0{float(speech_rate):.2f}\0{text}".encode("utf-8")).hexdigest()
+
+    def path(self, digest):
+        """Return the on-disk location of a clip"""
+        return os.path.join(self.directory, f"{digest}.mp3")
+
+    def get(self, text, lang, speech_rate):
+        """Return cached MP3 bytes, promoting disk hits into memory, or None"""
+        digest = self.digest(text, lang, speech_rate)
+        with self._lock:
+            data = self._entries.get(digest)
+            if data is not None:
+                self._entries.move_to_end(digest)
+                self.memory_hits += 1
+                return data
+        data = None
+        if self.directory:
+            try:
+                with open(self.path(digest), "rb") as f:
+                    data = f.read()
+            except OSError:
+                pass
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._remember(digest, data)
+        return data
+
+    def locate(self, text, lang, speech_rate):
+        """
+        Return the digest of a clip already on disk without reading it, or None. Only hits
+        are counted: callers follow a miss with synthesize_speech, whose get counts it.
+        """
+        digest = self.digest(text, lang, speech_rate)
+        if not (self.directory and os.path.exists(self.path(digest))):
+            return None
+        with self._lock:
+            self.disk_hits += 1
+        return digest
+
+    def put(self, text, lang, speech_rate, data):
+        """Store a clip in memory and, atomically, on disk"""
+        digest = self.digest(text, lang, speech_rate)
+        self._remember(digest, data)
+        if self.directory:
+            tmp_path = f"{self.path(digest)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path(digest))
+        return digest
+
+    def _remember(self, digest, data):
+        with self._lock:
+            previous = self._entries.pop(digest, None)
+            if previous is not None:
+                self.memory_bytes -= len(previous)
+            self._entries[digest] = data
+            self.memory_bytes += len(data)
+            while self.memory_bytes > self.max_memory_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self.memory_bytes -= len(evicted)
+
+    def stats(self):
+        """Return a snapshot of the cache counters"""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "memory_bytes": self.memory_bytes,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+@singleton
+def get_audio_cache():
+    """Return the audio cache shared by every session in this process"""
+    return AudioCache(AUDIO_CACHE_DIR, AUDIO_CACHE_MEMORY_BYTES)
+
+# Synthesize speech, serving repeats from the audio cache
+def synthesize_speech(text, lang, speech_rate=1.0):
+    """Return MP3 bytes for text spoken in lang, calling the TTS backend only on a cache miss"""
+    data = get_audio_cache().get(text, lang, speech_rate)
+    if data is None:
+        # Sessions asking for the same clip at the same time share one synthesis
+        data = get_speech_flights().do((text, lang, speech_rate), render_cached_speech, text, lang, speech_rate)
+    return data
+
+def render_cached_speech(text, lang, speech_rate):
+    """Synthesize a clip through the speech scheduler and store it in the audio cache"""
+    data = get_speech_scheduler().call(render_speech, text, lang)
+    get_audio_cache().put(text, lang, speech_rate, data)
+    return data
+
+# Call the configured speech synthesizer
+def render_speech(text, lang):
+    """Synthesize text with gTTS, or with the simulated synthesizer used for testing and benchmarks"""
+    with TTS_SECONDS.time(backend=TTS_BACKEND):
+        return _render_speech(text, lang)
+
+def _render_speech(text, lang):
+    if TTS_BACKEND == "simulated":
+        # Not playable audio: roughly the size of a real clip, so caches see realistic sizes
+        time.sleep(SIMULATED_TTS_DELAY)
+        seed = hashlib.sha256(f"{lang}\0{text}".encode("utf-8")).digest()
+        return b"ID3" + seed * max(1, len(text) * 8)
+    # gTTS (and the requests stack under it) is only imported on the first synthesis
+    from gtts import gTTS
+    
+    tts = gTTS(text=text, lang=lang, slow=False)
+    audio_bytes = BytesIO()
+    tts.write_to_fp(audio_bytes)
+    return audio_bytes.getvalue()
+
+
+# Pre-render speech for every phrasebook phrase in every supported language
+def prerender_phrasebook_audio(languages=None, max_workers=8, on_progress=None):
+    """
+    Synthesize and cache every phrasebook phrase in each language so phrasebook
+    playback never waits on gTTS. Clips already on disk are skipped.
+    Returns a dict with rendered, skipped and failed counts.
+    """
+    return prerender_speech(phrasebook_clips(languages), max_workers, on_progress)
+
+def phrasebook_clips(languages=None):
+    """Return (text, lang) for every phrasebook phrase in each language it has a translation for"""
+    phrase_index = get_phrase_index()
+    clips = []
+    for phrases in phrase_index.categories.values():
+        for phrase in phrases:
+            for lang in languages or SUPPORTED_LANGUAGES:
+                text = phrase_index.lookup(phrase, phrase_index.pivot_lang, lang)
+                if text is not None:
+                    clips.append((text, lang))
+    return clips
+
+# Synthesize clips that are not in the audio cache yet, on a pool of threads
+def prerender_speech(clips, max_workers=8, on_progress=None):
+    """Cache speech for (text, lang) clips, skipping the ones on disk; returns rendered, skipped and failed counts"""
+    cache = get_audio_cache()
+    counts = {"rendered": 0, "skipped": 0, "failed": 0}
+    missing = []
+    for text, lang in dict.fromkeys(clips):
+        if cache.locate(text, lang, BASE_SPEECH_RATE) is None:
+            missing.append((text, lang))
+        else:
+            counts["skipped"] += 1
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor, backend_priority(PRIORITY_BATCH):
+        futures = {submit_in_context(executor, synthesize_speech, text, lang, BASE_SPEECH_RATE): (text, lang)
+                   for text, lang in missing}
+        for done, future in enumerate(as_completed(futures), start=1):
+            try:
+                future.result()
+                counts["rendered"] += 1
+            except Exception:
+                counts["failed"] += 1
+            if on_progress:
+                on_progress(done, len(futures))
+    return counts
+
+# Look a translation up in the cache tiers without calling the backend
+def lookup_cached_translation(text, source_lang, target_lang, formality, offline=False, session_cache=None):
+    """Return a translation from the shared cache, the session cache (offline) or the persistent store, or None"""
+    with CACHE_LOOKUP_SECONDS.time():
+        result, tier = find_cached_translation(text, source_lang, target_lang, formality, offline, session_cache)
+    CACHE_LOOKUPS.inc(tier=tier)
+    return result
+
+def find_cached_translation(text, source_lang, target_lang, formality, offline=False, session_cache=None):
+    """Return (translation, tier) for the first cache tier holding text, or (None, "miss")"""
+    # The shared cache is consulted first, online or offline, so repeated phrases skip the backend
+    shared_cache = get_translation_cache()
+    shared_key = (text, source_lang, target_lang, bool(formality))
+    result = shared_cache.get(shared_key)
+    if result is not None:
+        return result, "shared"
+    
+    # Check if in offline mode and if we have a cached translation
+    if offline and session_cache is not None:
+        result = session_cache.get(shared_key)
+        if result is not None:
+            return result, "session"
+    
+    # Fall back to the persistent store, which survives restarts and is shared by all workers
+    store = get_translation_store()
+    if store is not None:
+        result = store.get(text, source_lang, target_lang, formality)
+        if result is not None:
+            shared_cache.put(shared_key, result)
+            return result, "store"
+    return None, "miss"
+
+# Translate a cache miss and write the result through to every cache tier
+def translate_uncached(text, source_lang, target_lang, formality, offline=False, session_cache=None):
+    """
+    Translate text that is not cached: offline this falls back to the phrasebook and
+    approximate matches, online it calls the backend (raising TranslationBackendError)
+    """
+    # If in offline mode with no cached translation, the local phrasebook can still answer
+    if offline:
+        return translate_locally(text, source_lang, target_lang, formality)
+    
+    # Sessions missing the same text at the same time share one backend call
+    cache_key = (text, source_lang, target_lang, bool(formality))
+    try:
+        result = get_translation_flights().do(cache_key, fetch_translation, text, source_lang, target_lang, formality)
+    except BackendUnavailableError:
+        # The backend is failing or saturated: answer from local data now rather than wait for it
+        BACKEND_FALLBACKS.inc()
+        result = session_cache.get(cache_key) if session_cache is not None else None
+        return result or translate_locally(text, source_lang, target_lang, formality, BACKEND_UNAVAILABLE_MESSAGE)
+    
+    # Cache the translation
+    if session_cache is not None:
+        session_cache[cache_key] = result
+    return result
+
+# Answers for texts no local source can translate
+OFFLINE_UNAVAILABLE_MESSAGE = "Translation not available in offline mode. Please connect to translate new text."
+BACKEND_UNAVAILABLE_MESSAGE = "Translation service temporarily unavailable. Please try again shortly."
+
+def is_local_answer(translation):
+    """Return True for the unavailable messages and approximate matches, which stand in for a real translation"""
+    return translation in (OFFLINE_UNAVAILABLE_MESSAGE, BACKEND_UNAVAILABLE_MESSAGE) or translation.startswith("[≈")
+
+# Translate without the backend, from the phrasebook or an approximate match in the translation memory
+def translate_locally(text, source_lang, target_lang, formality, unavailable=OFFLINE_UNAVAILABLE_MESSAGE):
+    """Return a phrasebook or approximate translation of text, or the unavailable message"""
+    if source_lang == target_lang:
+        return text
+    result = get_phrase_index().lookup(text, source_lang, target_lang)
+    if result is not None:
+        return result
+    match = find_approximate_translation(text, source_lang, target_lang, formality)
+    if match is not None:
+        return format_approximate_translation(*match)
+    return unavailable
+
+# Call the backend for a cache miss and write the result through to the shared tiers
+def fetch_translation(text, source_lang, target_lang, formality):
+    """Translate text with the backend and write it to the shared cache, the store and the translation memory"""
+    # Phrasebook hits are answered locally; everything else goes to the configured backend
+    result = get_translation_backend().translate(text, source_lang, target_lang, formality)
+    
+    get_translation_cache().put((text, source_lang, target_lang, bool(formality)), result)
+    store = get_translation_store()
+    if store is not None:
+        store.put(text, source_lang, target_lang, formality, result)
+    remember_translation(text, source_lang, target_lang, formality, result)
+    
+    return result
+
+# Call the backend once for several cache misses of a language pair and write the results through
+def fetch_translations(texts, source_lang, target_lang, formality):
+    """Translate a list of texts in one backend request, writing them through like fetch_translation"""
+    translated = get_translation_backend().translate_many(texts, source_lang, target_lang, formality)
+    
+    shared_cache = get_translation_cache()
+    for text, translation in zip(texts, translated):
+        shared_cache.put((text, source_lang, target_lang, bool(formality)), translation)
+        remember_translation(text, source_lang, target_lang, formality, translation)
+    store = get_translation_store()
+    if store is not None:
+        now = time.time()
+        store.put_rows((text, source_lang, target_lang, formality, translation, now)
+                       for text, translation in zip(texts, translated))
+    return translated
+
+# Worker pool used to translate the sentences of long inputs concurrently
+@singleton
+def get_translation_executor():
+    """Return the thread pool shared by every session for sentence-level translation"""
+    return ThreadPoolExecutor(max_workers=TRANSLATION_MAX_WORKERS, thread_name_prefix="translate")
+
+# Split text into sentences, keeping the separators so the output preserves the layout
+SENTENCE_BOUNDARY = re.compile(r"((?<=[.!?])\s+|(?<=[。！？])\s*|\n+)")
+
+def split_sentences(text):
+    """Return a list of (sentence, separator) pairs; joining them gives back the original text"""
+    parts = SENTENCE_BOUNDARY.split(text)
+    segments = []
+    for i in range(0, len(parts), 2):
+        sentence = parts[i]
+        separator = parts[i + 1] if i + 1 < len(parts) else ""
+        if sentence or separator:
+            segments.append((sentence, separator))
+    return segments
+
+def join_sentences(segments, translations):
+    """Reassemble split_sentences output in order, replacing each sentence with its translation"""
+    return "".join(
+        (translations.get(sentence, sentence) if sentence.strip() else sentence) + separator
+        for sentence, separator in segments
+    )
+
+# Translate sentences: cache hits are served inline, misses run concurrently on the worker pool
+def translate_sentences(sentences, source_lang, target_lang, formality, offline=False, session_cache=None):
+    """Return a dict mapping each distinct sentence to its translation (raises TranslationBackendError)"""
+    results = {}
+    misses = []
+    for sentence in dict.fromkeys(sentences):
+        cached = lookup_cached_translation(sentence, source_lang, target_lang, formality, offline, session_cache)
+        if cached is None:
+            misses.append(sentence)
+        else:
+            results[sentence] = cached
+    
+    if len(misses) == 1:
+        results[misses[0]] = translate_uncached(misses[0], source_lang, target_lang, formality, offline, session_cache)
+    elif misses:
+        # Latency follows the slowest sentence instead of the sum of all of them
+        executor = get_translation_executor()
+        futures = {
+            submit_in_context(executor, translate_uncached, sentence, source_lang, target_lang,
+                              formality, offline, session_cache): sentence
+            for sentence in misses
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+    return results
+
+# Stream a translation piece by piece, in order, as soon as each sentence is ready
+def iter_translation(text, source_lang, target_lang, formality, offline=False, session_cache=None):
+    """
+    Yield the translation of text one sentence (with its trailing separator) at a time.
+    Cached sentences are yielded immediately and misses are translated concurrently,
+    so the first piece arrives after the first sentence rather than the whole text.
+    Raises TranslationBackendError if a sentence cannot be translated.
+    """
+    start = time.perf_counter()
+    segments = split_sentences(text)
+    pending = {}
+    executor = None
+    for sentence, _ in segments:
+        if not sentence.strip() or sentence in pending:
+            continue
+        cached = lookup_cached_translation(sentence, source_lang, target_lang, formality, offline, session_cache)
+        if cached is not None:
+            pending[sentence] = cached
+        else:
+            executor = executor or get_translation_executor()
+            pending[sentence] = submit_in_context(executor, translate_uncached, sentence, source_lang,
+                                                  target_lang, formality, offline, session_cache)
+    
+    for sentence, separator in segments:
+        if not sentence.strip():
+            yield sentence + separator
+            continue
+        result = pending[sentence]
+        if isinstance(result, Future):
+            result = pending[sentence] = result.result()
+        yield result + separator
+    TRANSLATE_SECONDS.observe(time.perf_counter() - start)
+
+# Translate text, serving cached results before calling the backend
+def translate_text(text, source_lang, target_lang, formality, offline=False, session_cache=None):
+    """
+    Translate text through the caches, the offline store and the configured
+    translation backend (simulated by default, or an HTTP API like LibreTranslate).
+    Inputs with several sentences are translated sentence by sentence, concurrently.
+    session_cache is an optional per-session SessionCache (or dict) that is also
+    served when offline.
+    Raises TranslationBackendError if the backend fails.
+    """
+    if not text.strip():
+        return ""
+    if source_lang == target_lang:
+        return text
+    
+    with TRANSLATE_SECONDS.time():
+        segments = split_sentences(text)
+        sentences = [sentence for sentence, _ in segments if sentence.strip()]
+        if len(sentences) <= 1:
+            result = lookup_cached_translation(text, source_lang, target_lang, formality, offline, session_cache)
+            if result is None:
+                result = translate_uncached(text, source_lang, target_lang, formality, offline, session_cache)
+            return result
+        translations = translate_sentences(sentences, source_lang, target_lang, formality, offline, session_cache)
+        return join_sentences(segments, translations)
+
+# Translate text sentence by sentence, reusing translations of sentences that did not change
+def translate_incrementally(text, source_lang, target_lang, formality, previous=None, offline=False,
+                            session_cache=None):
+    """Return (translation, sentence_translations); sentences found in previous are not translated again"""
+    previous = previous or {}
+    segments = split_sentences(text)
+    sentences = [sentence for sentence, _ in segments if sentence.strip()]
+    # Sentences answered without the backend (offline or while it was unavailable) are retried
+    translations = {sentence: previous[sentence] for sentence in sentences
+                    if previous.get(sentence) and not is_local_answer(previous[sentence])}
+    translations.update(translate_sentences(
+        [sentence for sentence in sentences if sentence not in translations],
+        source_lang, target_lang, formality, offline, session_cache
+    ))
+    return join_sentences(segments, translations), translations
+
+# Worker pool used to translate one text into several languages concurrently
+@singleton
+def get_fanout_executor():
+    """Return the thread pool shared by every session for multi-language translation"""
+    return ThreadPoolExecutor(max_workers=FANOUT_MAX_WORKERS, thread_name_prefix="fanout")
+
+def translate_misses(texts, source_lang, target_lang, formality, offline=False, session_cache=None):
+    """Return a dict of translations for uncached texts of one language pair, in one backend request if online"""
+    if offline or len(texts) == 1:
+        # A single miss goes through translate_uncached so identical requests from other sessions coalesce
+        return {text: translate_uncached(text, source_lang, target_lang, formality, offline, session_cache)
+                for text in texts}
+    results = {}
+    try:
+        for start in range(0, len(texts), BATCH_CHUNK_SIZE):
+            chunk = texts[start:start + BATCH_CHUNK_SIZE]
+            results.update(zip(chunk, fetch_translations(chunk, source_lang, target_lang, formality)))
+    except BackendUnavailableError:
+        BACKEND_FALLBACKS.inc()
+        fallbacks = {text: translate_locally(text, source_lang, target_lang, formality, BACKEND_UNAVAILABLE_MESSAGE)
+                     for text in texts if text not in results}
+    else:
+        fallbacks = {}
+    if session_cache is not None:
+        for text, translation in results.items():
+            session_cache[(text, source_lang, target_lang, bool(formality))] = translation
+    results.update(fallbacks)
+    return results
+
+# Translate one text into several languages, splitting it once and sending each language's misses together
+def translate_fanout(text, source_lang, target_langs, formality, offline=False, session_cache=None):
+    """
+    Return a dict mapping each of target_langs to the translation of text.
+    The text is split into sentences once and looked up in the cache tiers for every
+    language; each language's misses then go to the backend in one request, and the
+    languages are translated concurrently, so the whole fan-out takes about as long
+    as a single translation. Raises TranslationBackendError if a request fails.
+    """
+    target_langs = list(dict.fromkeys(target_langs))
+    if not text.strip():
+        return dict.fromkeys(target_langs, "")
+    
+    with FANOUT_SECONDS.time():
+        segments = split_sentences(text)
+        sentences = [sentence for sentence, _ in segments if sentence.strip()]
+        # A single sentence is cached under the whole text, as translate_text does
+        units = list(dict.fromkeys(sentences)) if len(sentences) > 1 else [text]
+        
+        translations = {}
+        misses = {}
+        for lang in target_langs:
+            translations[lang] = {}
+            for unit in units:
+                cached = lookup_cached_translation(unit, source_lang, lang, formality, offline, session_cache)
+                if cached is None:
+                    misses.setdefault(lang, []).append(unit)
+                else:
+                    translations[lang][unit] = cached
+        
+        if offline:
+            # Offline misses are answered locally, so there is nothing to wait for
+            for lang, texts in misses.items():
+                translations[lang].update(translate_misses(texts, source_lang, lang, formality, True, session_cache))
+        elif misses:
+            executor = get_fanout_executor()
+            futures = {
+                submit_in_context(executor, translate_misses, texts, source_lang, lang, formality, False,
+                                  session_cache): lang
+                for lang, texts in misses.items()
+            }
+            for future in as_completed(futures):
+                translations[futures[future]].update(future.result())
+        
+        if len(sentences) <= 1:
+            return {lang: translations[lang][text] for lang in target_langs}
+        return {lang: join_sentences(segments, translations[lang]) for lang in target_langs}
+
+# Translate many texts at once, sending only cache misses to the backend in chunks
+@BATCH_SECONDS.time()
+def translate_batch(texts, source_lang, target_lang, formality, chunk_size=None, on_progress=None, offline=False):
+    """
+    Translate a list of texts and return the results in the same order.
+    Duplicates are translated once, cached texts are served in a single pass
+    and only the misses reach the backend, chunk_size texts per request.
+    """
+    texts = list(texts)
+    chunk_size = chunk_size or BATCH_CHUNK_SIZE
+    unique = [text for text in dict.fromkeys(texts) if text.strip()]
+    formality = bool(formality)
+    if source_lang == target_lang:
+        if on_progress:
+            on_progress(len(unique), len(unique))
+        return [text if text.strip() else "" for text in texts]
+    
+    # One pass over the shared cache, then one indexed query for whatever it did not have
+    shared_cache = get_translation_cache()
+    results = {}
+    for text in unique:
+        cached = shared_cache.get((text, source_lang, target_lang, formality))
+        if cached is not None:
+            results[text] = cached
+    
+    store = get_translation_store()
+    if store is not None:
+        pending = [text for text in unique if text not in results]
+        for text, translation in store.get_many(pending, source_lang, target_lang, formality).items():
+            results[text] = translation
+            shared_cache.put((text, source_lang, target_lang, formality), translation)
+    
+    misses = [text for text in unique if text not in results]
+    done = len(unique) - len(misses)
+    if on_progress:
+        on_progress(done, len(unique))
+    
+    # Offline, misses get the phrasebook or translation memory answer, as interactive translations do
+    if offline:
+        for text in misses:
+            results[text] = translate_locally(text, source_lang, target_lang, formality)
+        if on_progress:
+            on_progress(len(unique), len(unique))
+        misses = []
+    
+    # Bulk work queues behind interactive translations at the backend scheduler
+    with backend_priority(PRIORITY_BATCH):
+        for start in range(0, len(misses), chunk_size):
+            chunk = misses[start:start + chunk_size]
+            try:
+                results.update(zip(chunk, fetch_translations(chunk, source_lang, target_lang, formality)))
+            except BackendUnavailableError:
+                # A refused chunk falls back locally so the rows already translated are kept
+                BACKEND_FALLBACKS.inc()
+                for text in chunk:
+                    results[text] = translate_locally(text, source_lang, target_lang, formality,
+                                                      BACKEND_UNAVAILABLE_MESSAGE)
+            done += len(chunk)
+            if on_progress:
+                on_progress(done, len(unique))
+    
+    return [results.get(text, "") for text in texts]
+
+# Stream a CSV/TXT file through translate_batch, a chunk of rows at a time
+def translate_file(file, source_lang, target_lang, formality, column=None, on_progress=None, offline=False,
+                   output=None):
+    """
+    Translate a binary file object (an upload or an open file) without reading it
+    into memory all at once. TXT files are translated line by line; CSV files
+    (recognized by the file name) get a translation column added next to the chosen
+    source column. The result is written to the text stream output, or returned
+    as bytes when no output is given.
+    """
+    file.seek(0, io.SEEK_END)
+    total_bytes = file.tell() or 1
+    file.seek(0)
+    reader = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    buffer = io.StringIO() if output is None else None
+    out = output if output is not None else buffer
+    is_csv = getattr(file, "name", "").lower().endswith(".csv")
+    
+    lines_done = 0
+    try:
+        if is_csv:
+            rows = csv.reader(reader)
+            writer = csv.writer(out)
+            header = next(rows, None)
+            if header is None:
+                return b"" if buffer is not None else None
+            column_index = header.index(column) if column in header else 0
+            writer.writerow(header + [f"{header[column_index]}_{target_lang}"])
+        else:
+            rows = (line.rstrip("\r\n") for line in reader)
+        
+        while True:
+            chunk = list(itertools.islice(rows, BULK_FILE_CHUNK_ROWS))
+            if not chunk:
+                break
+            if is_csv:
+                sources = [row[column_index] if column_index < len(row) else "" for row in chunk]
+            else:
+                sources = chunk
+            translated = translate_batch(sources, source_lang, target_lang, formality, offline=offline)
+            if is_csv:
+                writer.writerows(row + [translation] for row, translation in zip(chunk, translated))
+            else:
+                out.writelines(f"{translation}\n" for translation in translated)
+            lines_done += len(chunk)
+            if on_progress:
+                on_progress(lines_done, min(file.tell() / total_bytes, 1.0))
+    finally:
+        reader.detach()
+    
+    return buffer.getvalue().encode("utf-8") if buffer is not None else None
+
+# Compact translation history record
+class HistoryEntry:
+    """A single translation in the history; slots keep each record small"""
+
+    __slots__ = ("id", "source_text", "translated_text", "source_lang", "target_lang", "timestamp", "display_time")
+
+    def __init__(self, id, source_text, translated_text, source_lang, target_lang, timestamp):
+        self.id = id
+        self.source_text = source_text
+        self.translated_text = translated_text
+        self.source_lang = source_lang
+        self.target_lang = target_lang
+        self.timestamp = timestamp
+        # Formatted once here instead of on every render of the History tab
+        self.display_time = timestamp.strftime('%Y-%m-%d %H:%M')
+
+# Record a translation in the history
+def add_to_history(history, source_text, translated_text, source_lang, target_lang, user_id=None):
+    """
+    Add a translation to history (a deque kept newest first, or None) and persist
+    it for user_id when the history store is enabled. Returns the new HistoryEntry,
+    or None when either text is empty.
+    """
+    if not source_text.strip() or not translated_text.strip():
+        return None
+    
+    history_item = HistoryEntry(
+        id=time.time_ns() // 1000,  # Unique ID based on timestamp
+        source_text=source_text,
+        translated_text=translated_text,
+        source_lang=source_lang,
+        target_lang=target_lang,
+        timestamp=datetime.now()
+    )
+    
+    # Add to the beginning of the history; a bounded deque drops the oldest item
+    if history is not None:
+        history.appendleft(history_item)
+    
+    # Persist it so it can be searched later and survives the session
+    store = get_history_store()
+    if store is not None and user_id:
+        store.add(user_id, history_item)
+    return history_item
+
+# Persistent, searchable translation history shared by every worker process
+class HistoryStore(SQLiteStore):
+    """
+    SQLite history per user, indexed by user and language pair, with an FTS5
+    full-text index over the source and translated text. Row ids grow with time
+    (imports renumber a user's entries that arrive out of order), so every index
+    already walks entries newest first.
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS history (
+                    id INTEGER PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    source_text TEXT NOT NULL,
+                    translated_text TEXT NOT NULL,
+                    source_lang TEXT NOT NULL,
+                    target_lang TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS history_user
+                    ON history (user_id);
+                CREATE INDEX IF NOT EXISTS history_user_pair
+                    ON history (user_id, source_lang, target_lang);
+                CREATE INDEX IF NOT EXISTS history_user_time
+                    ON history (user_id, created_at);
+                CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+                    source_text, translated_text,
+                    content='history', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                );
+                CREATE TRIGGER IF NOT EXISTS history_fts_insert AFTER INSERT ON history BEGIN
+                    INSERT INTO history_fts (rowid, source_text, translated_text)
+                    VALUES (new.id, new.source_text, new.translated_text);
+                END;
+                CREATE TRIGGER IF NOT EXISTS history_fts_delete AFTER DELETE ON history BEGIN
+                    INSERT INTO history_fts (history_fts, rowid, source_text, translated_text)
+                    VALUES ('delete', old.id, old.source_text, old.translated_text);
+                END;
+            """)
+
+    def add(self, user_id, entry):
+        """Persist a HistoryEntry for user_id and return its row id"""
+        with self._connect() as conn:
+            return conn.execute(
+                "INSERT INTO history (user_id, source_text, translated_text, source_lang, target_lang, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, entry.source_text, entry.translated_text, entry.source_lang,
+                 entry.target_lang, entry.timestamp.timestamp())
+            ).lastrowid
+
+    @staticmethod
+    def _match_expression(query):
+        # Every word must match as a prefix; quoting keeps FTS5 syntax characters literal
+        terms = query.split()
+        return " AND ".join('"' + term.replace('"', '""') + '"*' for term in terms) if terms else None
+
+    def page(self, user_id, limit, offset=0, query=None, source_lang=None, target_lang=None):
+        """Return up to limit HistoryEntry objects, newest first, optionally filtered by search text and language"""
+        columns = "h.id, h.source_text, h.translated_text, h.source_lang, h.target_lang, h.created_at"
+        conditions = ["h.user_id = ?"]
+        params = [user_id]
+        match = self._match_expression(query or "")
+        if match:
+            # Driving the query from the full-text index in rowid order stops after one page of matches
+            sql = f"SELECT {columns} FROM history_fts JOIN history AS h ON h.id = history_fts.rowid"
+            conditions.append("history_fts MATCH ?")
+            params.append(match)
+            order = "history_fts.rowid DESC"
+        else:
+            sql = f"SELECT {columns} FROM history AS h"
+            order = "h.id DESC"
+        if source_lang:
+            conditions.append("h.source_lang = ?")
+            params.append(source_lang)
+        if target_lang:
+            conditions.append("h.target_lang = ?")
+            params.append(target_lang)
+        sql += f" WHERE {' AND '.join(conditions)} ORDER BY {order} LIMIT ? OFFSET ?"
+        params += [limit, offset]
+        return [
+            HistoryEntry(row_id, source_text, translated_text, src, tgt, datetime.fromtimestamp(created_at))
+            for row_id, source_text, translated_text, src, tgt, created_at
+            in self._connect().execute(sql, params)
+        ]
+
+    def count(self, user_id):
+        """Return the number of history entries stored for user_id"""
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM history WHERE user_id = ?", (user_id,)
+        ).fetchone()[0]
+
+    def add_rows(self, rows):
+        """
+        Insert (user_id, source_text, translated_text, source_lang, target_lang, created_at)
+        rows in one transaction, skipping rows already stored. Returns the number inserted.
+        """
+        with self._connect() as conn:
+            return conn.executemany(
+                "INSERT INTO history (user_id, source_text, translated_text, source_lang, target_lang, created_at) "
+                "SELECT ?1, ?2, ?3, ?4, ?5, ?6 WHERE NOT EXISTS (SELECT 1 FROM history WHERE user_id = ?1 "
+                "AND created_at = ?6 AND source_text = ?2 AND translated_text = ?3 "
+                "AND source_lang = ?4 AND target_lang = ?5)",
+                rows
+            ).rowcount
+
+    def resequence(self, user_id):
+        """Renumber the entries of user_id in time order if imports left them out of order; returns True if they were"""
+        conn = self._connect()
+        out_of_order = conn.execute(
+            "SELECT EXISTS (SELECT 1 FROM (SELECT created_at < LAG(created_at) OVER (ORDER BY id) AS early "
+            "FROM history WHERE user_id = ?) WHERE early)",
+            (user_id,)
+        ).fetchone()[0]
+        if not out_of_order:
+            return False
+        # Copies get new row ids above every existing one, in time order; then the originals go
+        with conn:
+            last_id = conn.execute("SELECT MAX(id) FROM history").fetchone()[0]
+            conn.execute(
+                "INSERT INTO history (user_id, source_text, translated_text, source_lang, target_lang, created_at) "
+                "SELECT user_id, source_text, translated_text, source_lang, target_lang, created_at FROM history "
+                "WHERE user_id = ? ORDER BY created_at, id",
+                (user_id,)
+            )
+            conn.execute("DELETE FROM history WHERE user_id = ? AND id <= ?", (user_id, last_id))
+        return True
+
+    def iter_rows(self, user_id=None):
+        """Yield (user_id, source_text, translated_text, source_lang, target_lang, created_at) rows, oldest first"""
+        sql = "SELECT user_id, source_text, translated_text, source_lang, target_lang, created_at FROM history"
+        params = ()
+        if user_id:
+            sql += " WHERE user_id = ?"
+            params = (user_id,)
+        return self._stream(sql + " ORDER BY id", params)
+
+    def popular(self, limit):
+        """Return the limit most often translated (source_text, source_lang, target_lang) across all users"""
+        return self._connect().execute(
+            "SELECT source_text, source_lang, target_lang FROM history "
+            "GROUP BY source_text, source_lang, target_lang ORDER BY COUNT(*) DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+
+    def clear(self, user_id):
+        """Delete every history entry of user_id"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM history WHERE user_id = ?", (user_id,))
+
+@singleton
+def get_history_store():
+    """Return the persistent history store, or None if it is disabled or unavailable"""
+    if not HISTORY_STORE_PATH:
+        return None
+    try:
+        return HistoryStore(HISTORY_STORE_PATH)
+    except sqlite3.Error as e:
+        logger.warning("Persistent history unavailable: %s", e)
+        return None
+
+# Columns of the export files, one JSON array per row after a header line
+TRANSLATION_COLUMNS = ("text", "source_lang", "target_lang", "formality", "translation", "updated_at")
+HISTORY_COLUMNS = ("user_id", "source_text", "translated_text", "source_lang", "target_lang", "created_at")
+
+# Streaming, gzip-compressed JSON Lines files for moving caches and history between nodes and devices
+def write_transfer_file(target, kind, columns, rows, on_progress=None):
+    """
+    Write rows to target (a path or binary file) as gzip-compressed JSON Lines: a header
+    naming the kind and columns, then one compact JSON array per row. Rows are consumed
+    TRANSFER_CHUNK_ROWS at a time, so memory stays flat however many there are.
+    Returns the number of rows written.
+    """
+    rows = iter(rows)
+    count = 0
+    with gzip.open(target, "wt", encoding="utf-8", compresslevel=TRANSFER_COMPRESSION) as f:
+        f.write(json.dumps({"kind": kind, "version": 1, "columns": list(columns)}) + "\n")
+        while True:
+            chunk = list(itertools.islice(rows, TRANSFER_CHUNK_ROWS))
+            if not chunk:
+                break
+            f.write("".join(json.dumps(row, ensure_ascii=False, separators=(",", ":")) + "\n" for row in chunk))
+            count += len(chunk)
+            if on_progress:
+                on_progress(count)
+    return count
+
+def read_transfer_file(source, kind, columns):
+    """Yield rows of a write_transfer_file file in chunks of TRANSFER_CHUNK_ROWS; raises ValueError for other files"""
+    with gzip.open(source, "rt", encoding="utf-8") as f:
+        try:
+            header = json.loads(f.readline())
+        except (ValueError, OSError) as e:
+            raise ValueError(f"Not a translator export file: {e}")
+        if not isinstance(header, dict) or header.get("kind") != kind:
+            raise ValueError(f"Not a {kind} export file")
+        if header.get("columns") != list(columns):
+            raise ValueError(f"Unexpected columns in {kind} export: {header.get('columns')}")
+        chunk = []
+        for line_number, line in enumerate(f, start=2):
+            row = json.loads(line)
+            if not isinstance(row, list) or len(row) != len(columns):
+                raise ValueError(f"Malformed row on line {line_number}")
+            chunk.append(row)
+            if len(chunk) >= TRANSFER_CHUNK_ROWS:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+def export_translations(target, on_progress=None):
+    """Stream the persistent translation store to target; returns the number of translations written"""
+    store = get_translation_store()
+    if store is None:
+        raise ValueError("The translation store is disabled (TRANSLATOR_STORE_PATH is empty)")
+    return write_transfer_file(target, "translations", TRANSLATION_COLUMNS, store.iter_rows(), on_progress)
+
+def import_translations(source, on_progress=None):
+    """Load an export into the persistent translation store, replacing equal keys; returns the rows read"""
+    store = get_translation_store()
+    if store is None:
+        raise ValueError("The translation store is disabled (TRANSLATOR_STORE_PATH is empty)")
+    count = 0
+    for chunk in read_transfer_file(source, "translations", TRANSLATION_COLUMNS):
+        store.put_rows(chunk)
+        count += len(chunk)
+        if on_progress:
+            on_progress(count)
+    return count
+
+def export_history(target, user_id=None, on_progress=None):
+    """Stream the history of user_id (or of every profile) to target, oldest first; returns the entries written"""
+    store = get_history_store()
+    if store is None:
+        raise ValueError("Persistent history is disabled (TRANSLATOR_HISTORY_PATH is empty)")
+    return write_transfer_file(target, "history", HISTORY_COLUMNS, store.iter_rows(user_id), on_progress)
+
+def import_history(source, user_id=None, on_progress=None):
+    """
+    Append an exported history to the history store, under user_id when given or else
+    under each entry's original profile. Entries already there (same profile, time and
+    texts) are skipped, so importing a file twice is harmless. Returns the number of
+    entries imported.
+    """
+    store = get_history_store()
+    if store is None:
+        raise ValueError("Persistent history is disabled (TRANSLATOR_HISTORY_PATH is empty)")
+    count = read = 0
+    users = set()
+    for chunk in read_transfer_file(source, "history", HISTORY_COLUMNS):
+        if user_id:
+            chunk = [[user_id, *row[1:]] for row in chunk]
+        count += store.add_rows(chunk)
+        read += len(chunk)
+        users.update(row[0] for row in chunk)
+        if on_progress:
+            on_progress(read)
+    # Pages and searches walk row ids newest first, so entries older than existing ones are renumbered
+    for user in users:
+        store.resequence(user)
+    return count
+
+# Texts the app is likely to be asked for first: the phrasebook in every direction and popular history
+def plan_warm_up_translations(languages=None, top_history=WARMUP_TOP_HISTORY):
+    """Return {(source_lang, target_lang, formality): [texts]} for the phrasebook and the top history texts"""
+    languages = languages or SUPPORTED_LANGUAGES
+    phrase_index = get_phrase_index()
+    plan = defaultdict(dict)
+    
+    def add(text, source_lang, target_lang):
+        # The app caches each sentence of a longer text separately, so warm the same units
+        for sentence, _ in split_sentences(text):
+            if sentence.strip():
+                for formality in (True, False):
+                    plan[source_lang, target_lang, formality][sentence] = None
+    
+    for phrases in phrase_index.categories.values():
+        for phrase in phrases:
+            for source_lang in languages:
+                text = phrase_index.lookup(phrase, phrase_index.pivot_lang, source_lang)
+                if text is not None:
+                    for target_lang in languages:
+                        if target_lang != source_lang:
+                            add(text, source_lang, target_lang)
+    
+    history = get_history_store()
+    if history is not None and top_history:
+        for text, source_lang, target_lang in history.popular(top_history):
+            if source_lang != target_lang and source_lang in languages and target_lang in languages:
+                add(text, source_lang, target_lang)
+    return {key: list(texts) for key, texts in plan.items()}
+
+def plan_warm_up_speech(languages=None, top_history=WARMUP_TOP_HISTORY):
+    """Return (text, lang) clips for the phrasebook and both sides of the top history texts"""
+    clips = phrasebook_clips(languages)
+    history = get_history_store()
+    store = get_translation_store()
+    if history is not None and top_history:
+        for text, source_lang, target_lang in history.popular(top_history):
+            if languages and not {source_lang, target_lang} <= set(languages):
+                continue
+            clips.append((text, source_lang))
+            # Listen Translation speaks the formal translation by default; after the translation
+            # stage its sentences are in the store, so this makes no backend calls
+            if store is not None:
+                try:
+                    clips.append((translate_text(text, source_lang, target_lang, True), target_lang))
+                except TranslationBackendError:
+                    pass
+    return clips
+
+# Process pool tasks: each worker process has its own caches but shares the persistent store and audio directory
+def init_warm_up_worker(processes):
+    """Give this worker its share of the backend rate limits, so the whole pool stays within them"""
+    for scheduler in get_schedulers():
+        scheduler.share_limits(processes)
+
+def warm_translations(source_lang, target_lang, formality, texts):
+    """Translate texts into the persistent store; returns how many were stored"""
+    translate_batch(texts, source_lang, target_lang, formality)
+    # Chunks refused by the backend scheduler get local answers, which are not stored
+    return len(get_translation_store().get_many(texts, source_lang, target_lang, formality))
+
+def warm_speech(clips, threads):
+    """Synthesize clips into the audio cache; returns the prerender_speech counts"""
+    return prerender_speech(clips, max_workers=threads)
+
+# Deploy-time warm-up, so the first user after a deploy gets cache-hit latency
+def warm_up(languages=None, top_history=WARMUP_TOP_HISTORY, processes=WARMUP_PROCESSES, threads=4,
+            speech=True, on_progress=None):
+    """
+    Precompute translations of every phrasebook phrase between all pairs of languages
+    in both formalities, plus the top_history most frequent history texts, and render
+    their speech. The work is split across a pool of processes writing to the persistent
+    store and the audio cache (translations go to the backend in batches, and each
+    worker synthesizes speech on threads); entries already there are skipped. on_progress(stage, done, total) reports each
+    finished task. Returns a dict of counts.
+    """
+    counts = {"translated": 0, "cached": 0, "failed": 0, "rendered": 0, "skipped": 0, "speech_failed": 0}
+    store = get_translation_store()
+    
+    # Only misses are sent to the workers, in tasks of WARMUP_TASK_SIZE texts
+    tasks = []
+    if store is None:
+        logger.warning("Translation store disabled (TRANSLATOR_STORE_PATH is empty); only speech is warmed up")
+    else:
+        for (source_lang, target_lang, formality), texts in plan_warm_up_translations(languages, top_history).items():
+            found = store.get_many(texts, source_lang, target_lang, formality)
+            counts["cached"] += len(found)
+            missing = [text for text in texts if text not in found]
+            for start in range(0, len(missing), WARMUP_TASK_SIZE):
+                tasks.append((source_lang, target_lang, formality, missing[start:start + WARMUP_TASK_SIZE]))
+    
+    # Spawned workers start clean instead of inheriting this process's threads and SQLite connections;
+    # each has its own schedulers, so each gets 1/processes of the backend rate limits
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context, initializer=init_warm_up_worker,
+                             initargs=(processes,)) as pool:
+        futures = {pool.submit(warm_translations, *task): task for task in tasks}
+        for done, future in enumerate(as_completed(futures), start=1):
+            texts = futures[future][3]
+            try:
+                stored = future.result()
+            except (TranslationBackendError, sqlite3.Error) as e:
+                logger.warning("Warm-up translation task failed: %s", e)
+                stored = 0
+            counts["translated"] += stored
+            counts["failed"] += len(texts) - stored
+            if on_progress:
+                on_progress("translations", done, len(futures))
+        
+        if speech:
+            clips = list(dict.fromkeys(plan_warm_up_speech(languages, top_history)))
+            cache = get_audio_cache()
+            missing = [clip for clip in clips if cache.locate(*clip, BASE_SPEECH_RATE) is None]
+            counts["skipped"] += len(clips) - len(missing)
+            # Smaller tasks when there are few clips, so every worker gets some
+            size = max(1, min(WARMUP_TASK_SIZE, math.ceil(len(missing) / processes)))
+            futures = [pool.submit(warm_speech, missing[start:start + size], threads)
+                       for start in range(0, len(missing), size)]
+            for done, future in enumerate(as_completed(futures), start=1):
+                result = future.result()
+                counts["rendered"] += result["rendered"]
+                counts["skipped"] += result["skipped"]
+                counts["speech_failed"] += result["failed"]
+                if on_progress:
+                    on_progress("speech", done, len(futures))
+    return counts
+
+# Language code to name mapping
+def get_language_name(lang_code):
+    """Convert language code to full name"""
+    languages = {
+        'en': 'English',
+        'es': 'Spanish',
+        'fr': 'French',
+        'de': 'German',
+        'it': 'Italian',
+        'ja': 'Japanese',
+        'ko': 'Korean',
+        'zh': 'Chinese',
+        'ru': 'Russian',
+        'ar': 'Arabic',
+        'hi': 'Hindi',
+        'pt': 'Portuguese'
+    }
+    return languages.get(lang_code, lang_code)
@@ -0,0 +1,280 @@
+"""
+In-process performance metrics: counters, gauges and latency histograms shared by
+every thread of the process, rendered in the Prometheus text exposition format.
+
+The HTTP service serves them at /metrics. Streamlit cannot add endpoints, so the
+app can instead rewrite a file every few seconds (TRANSLATOR_METRICS_FILE) for a
+node exporter textfile collector, and shows them in the Settings tab diagnostics.
+"""
+import bisect
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Set to 0 to turn every metric into a no-op
+METRICS_ENABLED = os.environ.get("TRANSLATOR_METRICS_ENABLED", "1").lower() not in ("0", "false", "no", "")
+
+# File rewritten with the Prometheus text every TRANSLATOR_METRICS_INTERVAL seconds (empty to disable)
+METRICS_FILE = os.environ.get("TRANSLATOR_METRICS_FILE", "")
+METRICS_FILE_INTERVAL = float(os.environ.get("TRANSLATOR_METRICS_INTERVAL", "15"))
+
+# Latency histogram bucket bounds in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(labels, extra=()):
+    """Return the Prometheus label block for a tuple of (name, value) pairs"""
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def format_value(value):
+    """Return a sample value the way Prometheus writes it"""
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base class: a named metric with one series per combination of label values"""
+
+    kind = "untyped"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple((name, labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self):
+        """Yield (suffix, labels, value) for every sample of the metric"""
+        raise NotImplementedError
+
+    def render(self):
+        """Return the metric in the Prometheus text format"""
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{self.name}{suffix}{format_labels(labels)} {format_value(value)}"
+                     for suffix, labels, value in self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._series.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            series = list(self._series.items())
+        for key, value in series:
+            yield "", key, value
+
+
+class Gauge(Metric):
+    """Current value, either set explicitly or read from a callback when rendered"""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), callback=None):
+        super().__init__(name, help, labelnames)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._series[self._key(labels)] = value
+
+    def samples(self):
+        if self.callback is not None:
+            try:
+                value = self.callback()
+            except Exception:
+                return
+            # A callback returns a number, or a dict mapping label tuples to numbers
+            values = value if isinstance(value, dict) else {(): value}
+            for key, sample in values.items():
+                yield "", tuple(zip(self.labelnames, key)), sample
+            return
+        with self._lock:
+            series = list(self._series.items())
+        for key, value in series:
+            yield "", key, value
+
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets, with their sum and count"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time spent in the with block, even when it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def stats(self):
+        """Yield (labels, count, sum, p50, p95, p99) for every series"""
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        for key, counts, total, count in series:
+            yield (key, count, total, *(self._quantile(counts, count, q) for q in (0.5, 0.95, 0.99)))
+
+    def _quantile(self, counts, count, q):
+        # Linear interpolation inside the bucket holding the q-th observation, like histogram_quantile()
+        if not count:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if seen + bucket_count >= rank and bucket_count:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+    def samples(self):
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                yield "_bucket", key + (("le", format_value(float(bound)) if bound != math.inf else "+Inf"),), cumulative
+            yield "_sum", key, total
+            yield "_count", key, count
+
+
+class MetricsRegistry:
+    """Named metrics of the process; asking for an existing name returns the same metric"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=(), callback=None):
+        return self._register(Gauge, name, help, labelnames, callback=callback)
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram, name, help, labelnames, buckets=buckets)
+
+    def metrics(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format"""
+        return "\n".join(metric.render() for metric in self.metrics()) + "\n"
+
+    def write(self, path):
+        """Atomically replace path with the current Prometheus text"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def latency_table(self):
+        """Return one row per histogram series with its count and p50/p95/p99 in milliseconds"""
+        rows = []
+        for metric in self.metrics():
+            if isinstance(metric, Histogram):
+                for labels, count, total, p50, p95, p99 in metric.stats():
+                    rows.append({
+                        "metric": metric.name + format_labels(labels),
+                        "count": count,
+                        "mean ms": round(total / count * 1000, 2) if count else 0.0,
+                        "p50 ms": round(p50 * 1000, 2),
+                        "p95 ms": round(p95 * 1000, 2),
+                        "p99 ms": round(p99 * 1000, 2),
+                    })
+        return rows
+
+    def value_table(self):
+        """Return one row per counter and gauge series with its current value"""
+        rows = []
+        for metric in self.metrics():
+            if not isinstance(metric, Histogram):
+                for _, labels, value in metric.samples():
+                    rows.append({"metric": metric.name + format_labels(labels), "value": value})
+        return rows
+
+
+# Metrics of this process
+REGISTRY = MetricsRegistry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+_exporter_lock = threading.Lock()
+_exporter = None
+
+
+def start_file_exporter(path=None, interval=None):
+    """Rewrite path with the metrics every interval seconds on a daemon thread (at most one per process)"""
+    global _exporter
+    path = path or METRICS_FILE
+    interval = interval or METRICS_FILE_INTERVAL
+    if not path or not METRICS_ENABLED:
+        return None
+    with _exporter_lock:
+        if _exporter is None:
+            def run():
+                while True:
+                    try:
+                        REGISTRY.write(path)
+                    except OSError:
+                        pass
+                    time.sleep(interval)
+
+            _exporter = threading.Thread(target=run, name="metrics-exporter", daemon=True)
+            _exporter.start()
+    return _exporter
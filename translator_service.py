@@ -0,0 +1,245 @@
+"""
+Headless HTTP/JSON API over translator_core. It serves the same caches, stores and
+backends as the Streamlit app without re-running a script per request.
+
+    python translator_service.py --port 8080
+    curl -d '{"text": "Where is the station?", "source": "en", "target": "es"}' http://127.0.0.1:8080/translate
+
+Endpoints:
+    GET  /health                                     liveness check
+    GET  /stats                                      cache counters and backend scheduler state
+    GET  /metrics                                    performance metrics (Prometheus text format)
+    POST /translate  {"text", "source", "target", "formality", "offline", "profile"}
+    POST /batch      {"texts", "source", "target", "formality", "offline"}
+    GET  /speech?text=...&lang=...                   MP3 audio
+    GET  /history?profile=...&q=...&limit=...&offset=...
+"""
+import argparse
+import json
+import logging
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import translator_core as core
+import translator_metrics as metrics
+
+# Largest request body accepted, in bytes
+MAX_REQUEST_BYTES = 1024 * 1024
+
+# Largest page of history returned by /history
+MAX_HISTORY_LIMIT = 100
+
+logger = logging.getLogger(__name__)
+
+REQUEST_SECONDS = metrics.histogram(
+    "translator_http_request_seconds", "Time to handle a request to the translation service", ("path", "status"))
+
+
+class RequestError(Exception):
+    """Raised by request handlers to answer with an HTTP error status"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class TranslatorHandler(BaseHTTPRequestHandler):
+    # Keep-alive connections without Nagle delays, as in stub_server.StubTranslationHandler
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def send_body(self, status, content_type, data):
+        self.status = status
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_json(self, status, body):
+        self.send_body(status, "application/json", json.dumps(body, ensure_ascii=False).encode("utf-8"))
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if length > MAX_REQUEST_BYTES:
+            raise RequestError(413, f"Request body larger than {MAX_REQUEST_BYTES} bytes")
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as e:
+            raise RequestError(400, f"Invalid JSON: {e}")
+        if not isinstance(payload, dict):
+            raise RequestError(400, "Request body must be a JSON object")
+        return payload
+
+    def dispatch(self, routes):
+        url = urlsplit(self.path)
+        handler = routes.get(url.path)
+        if handler is None:
+            self.send_json(404, {"error": "Not found"})
+            return
+        self.status = 500
+        start = time.perf_counter()
+        try:
+            handler({key: values[-1] for key, values in parse_qs(url.query).items()})
+        except RequestError as e:
+            self.send_json(e.status, {"error": str(e)})
+        except core.TranslationBackendError as e:
+            self.send_json(502, {"error": str(e)})
+        except (BrokenPipeError, ConnectionResetError):
+            # The client went away; there is nobody to answer
+            self.close_connection = True
+        except Exception:
+            # Store and other unexpected errors still get an answer and a timing
+            logger.exception("Error handling %s %s", self.command, url.path)
+            self.send_json(500, {"error": "Internal server error"})
+        REQUEST_SECONDS.observe(time.perf_counter() - start, path=url.path, status=self.status)
+
+    def do_GET(self):
+        self.dispatch({
+            "/health": self.get_health,
+            "/stats": self.get_stats,
+            "/metrics": self.get_metrics,
+            "/speech": self.get_speech,
+            "/history": self.get_history,
+        })
+
+    def do_POST(self):
+        self.dispatch({
+            "/translate": self.post_translate,
+            "/batch": self.post_batch,
+        })
+
+    def get_health(self, params):
+        self.send_json(200, {"status": "ok"})
+
+    def get_stats(self, params):
+        self.send_json(200, {
+            "translation_cache": core.get_translation_cache().stats(),
+            "audio_cache": core.get_audio_cache().stats(),
+            "schedulers": {scheduler.name: scheduler.stats() for scheduler in core.get_schedulers()},
+        })
+
+    def get_metrics(self, params):
+        self.send_body(200, "text/plain; version=0.0.4; charset=utf-8", metrics.REGISTRY.render().encode("utf-8"))
+
+    def post_translate(self, params):
+        payload = self.read_json()
+        text = payload.get("text")
+        if not isinstance(text, str):
+            raise RequestError(400, "'text' must be a string")
+        source_lang, target_lang = language_pair(payload)
+        formality = bool(payload.get("formality", True))
+        translation = core.translate_text(
+            text, source_lang, target_lang, formality, offline=bool(payload.get("offline", False))
+        )
+        if payload.get("profile"):
+            core.add_to_history(None, text, translation, source_lang, target_lang, str(payload["profile"]))
+        self.send_json(200, {"translation": translation})
+
+    def post_batch(self, params):
+        payload = self.read_json()
+        texts = payload.get("texts")
+        if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+            raise RequestError(400, "'texts' must be a list of strings")
+        source_lang, target_lang = language_pair(payload)
+        translations = core.translate_batch(
+            texts, source_lang, target_lang, bool(payload.get("formality", True)),
+            offline=bool(payload.get("offline", False))
+        )
+        self.send_json(200, {"translations": translations})
+
+    def get_speech(self, params):
+        text = params.get("text", "")
+        lang = params.get("lang", "")
+        if not text.strip() or lang not in core.SUPPORTED_LANGUAGES:
+            raise RequestError(400, "'text' and a supported 'lang' are required")
+        try:
+            data = core.synthesize_speech(text, lang, core.BASE_SPEECH_RATE)
+        except Exception as e:
+            raise RequestError(502, f"Speech synthesis failed: {e}")
+        self.send_body(200, "audio/mpeg", data)
+
+    def get_history(self, params):
+        profile = params.get("profile")
+        if not profile:
+            raise RequestError(400, "'profile' is required")
+        store = core.get_history_store()
+        if store is None:
+            raise RequestError(503, "Persistent history is disabled")
+        try:
+            limit = max(1, min(int(params.get("limit", 20)), MAX_HISTORY_LIMIT))
+            offset = int(params.get("offset", 0))
+        except ValueError:
+            raise RequestError(400, "'limit' and 'offset' must be integers")
+        if offset < 0:
+            raise RequestError(400, "'offset' must not be negative")
+        entries = store.page(profile, limit, offset, params.get("q"),
+                             params.get("source"), params.get("target"))
+        self.send_json(200, {"entries": [history_entry_json(entry) for entry in entries]})
+
+
+def language_pair(payload):
+    """Return the validated (source, target) languages of a request"""
+    source_lang = payload.get("source", "en")
+    target_lang = payload.get("target")
+    for lang in (source_lang, target_lang):
+        if lang not in core.SUPPORTED_LANGUAGES:
+            raise RequestError(400, f"Unsupported language: {lang!r}")
+    return source_lang, target_lang
+
+
+def history_entry_json(entry):
+    """Return a JSON-serializable dict for a HistoryEntry"""
+    return {
+        "id": entry.id,
+        "source_text": entry.source_text,
+        "translated_text": entry.translated_text,
+        "source_lang": entry.source_lang,
+        "target_lang": entry.target_lang,
+        "timestamp": entry.timestamp.isoformat(timespec="seconds"),
+    }
+
+
+class TranslatorServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Bursts of new connections queue in the kernel instead of being reset
+    request_queue_size = 128
+
+
+def make_server(host="127.0.0.1", port=0, quiet=True):
+    """Create a threaded translation server; port 0 picks a free port (see server.server_address)"""
+    server = TranslatorServer((host, port), TranslatorHandler)
+    server.quiet = quiet
+    return server
+
+
+def serve(host="127.0.0.1", port=8080):
+    """Run the translation service until interrupted"""
+    server = make_server(host, port, quiet=False)
+    metrics.start_file_exporter()
+    print(f"Translation service listening on http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the headless translation service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    serve(args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()